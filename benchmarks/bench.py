@@ -0,0 +1,216 @@
+import os
+import random
+import resource
+import sys
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from json import dump, load
+from multiprocessing import get_context
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# the modules import each other by their plain names, as run from tesselatepy/
+SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tesselatepy')
+sys.path.insert(0, SOURCE)
+
+from poincare_disk import DiskParams, PoincareDisk, count_polys, determine_polys
+from polygon import EdgeCache, get_scl
+from circular_curve import DEFAULT_FLATNESS
+from backend import BACKENDS
+from decimal_math import decimal_context
+from main import main
+from unique_lines import get_unique_lines
+from cli import load_image
+
+
+TILINGS = [(4, 5), (5, 4), (7, 3), (3, 7), (6, 4)]
+LAYERS = [2, 4]
+SIZES = [400, 1600]
+EDGES = ['fish2.png', 'gfish2.png', 'rfish2.png']
+# a stage is slower than its baseline by more than this fraction and
+# MIN_SECONDS, or needs more than this fraction of memory
+TOLERANCE = 0.25
+MIN_SECONDS = 0.05
+
+Case = Tuple[int, int, int, int, str, str]
+
+# (polys, points) of what was done, the points are 0 where they don't apply
+Result = Tuple[int, int]
+
+# Each stage prepares its input, untimed, and returns the timed part.
+def stage_count_polys(params: DiskParams) -> Callable[[], Result]:
+  return lambda: (count_polys(params)[1], 0)
+
+def stage_determine_polys(params: DiskParams) -> Callable[[], Result]:
+  inner, total = count_polys(params)
+  return lambda: (len(determine_polys(inner, total, params).polys), 0)
+
+def flatten(params: DiskParams, flatness: Optional[float], shared: bool = False) -> Callable[[], Result]:
+  disk = PoincareDisk.new(params)
+  def run() -> Result:
+    scl = None
+    edges = EdgeCache() if shared else None
+    points = 0
+    for poly in disk.polys:
+      scl = get_scl(poly, params.width, params.height, flatness, scl, edges)
+      points += len(scl)
+    return len(disk.polys), points
+  return run
+
+def stage_get_scl(params: DiskParams) -> Callable[[], Result]:
+  return flatten(params, DEFAULT_FLATNESS)
+
+# get_scl taking the sides shared with earlier polygons from an EdgeCache
+def stage_shared_edges(params: DiskParams) -> Callable[[], Result]:
+  return flatten(params, DEFAULT_FLATNESS, True)
+
+# get_scl without a flatness subdivides with CircularCurve.interpolate
+def stage_interpolate(params: DiskParams) -> Callable[[], Result]:
+  return flatten(params, None)
+
+def stage_get_unique_lines(params: DiskParams) -> Callable[[], Result]:
+  disk = PoincareDisk.new(params)
+  def run() -> Result:
+    get_unique_lines(disk.polys)
+    return len(disk.polys), 0
+  return run
+
+def render(params: DiskParams, poincare: bool) -> Callable[[], Result]:
+  fishes = [] if poincare else [load_image(os.path.join(SOURCE, edge)) for edge in EDGES]
+  def run() -> Result:
+    with TemporaryDirectory() as folder:
+      main(params, fishes, os.path.join(folder, 'bench.png'), poincare, show=False)
+    return count_polys(params)[1], 0
+  return run
+
+def stage_poincare(params: DiskParams) -> Callable[[], Result]:
+  return render(params, True)
+
+def stage_klein(params: DiskParams) -> Callable[[], Result]:
+  return render(params, False)
+
+STAGES: Dict[str, Callable[[DiskParams], Callable[[], Result]]] = {
+  'count_polys': stage_count_polys,
+  'determine_polys': stage_determine_polys,
+  'get_scl': stage_get_scl,
+  'shared_edges': stage_shared_edges,
+  'interpolate': stage_interpolate,
+  'get_unique_lines': stage_get_unique_lines,
+  'poincare': stage_poincare,
+  'klein': stage_klein,
+}
+
+# Runs in a process of its own, so the peak RSS is the stage's own. The
+# random colors are seeded, the output of the renderers is dropped.
+def run_case(case: Case) -> Dict[str, Any]:
+  p, q, layers, size, backend, stage = case
+  random.seed(0)
+  params = DiskParams(p, q, layers, size, [], backend)
+  with open(os.devnull, 'w') as devnull, redirect_stdout(devnull), decimal_context():
+    run = STAGES[stage](params)
+    start = perf_counter()
+    polys, points = run()
+    seconds = perf_counter() - start
+  return {
+    'p': p,
+    'q': q,
+    'layers': layers,
+    'size': size,
+    'backend': backend,
+    'stage': stage,
+    'seconds': seconds,
+    'peak_rss': peak_rss(),
+    'polys': polys,
+    'points': points,
+    'polys_per_second': polys / seconds if seconds else 0,
+    'points_per_second': points / seconds if seconds else 0,
+  }
+
+# bytes of the process, ru_maxrss is in kilobytes except on macOS
+def peak_rss() -> int:
+  maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+# the fastest of repeat runs, each in a new process
+def measure(case: Case, repeat: int) -> Dict[str, Any]:
+  context = get_context('spawn')
+  runs = []
+  for _ in range(repeat):
+    with context.Pool(1) as pool:
+      runs.append(pool.apply(run_case, (case,)))
+  return min(runs, key=lambda run: run['seconds'])
+
+def key(result: Dict[str, Any]) -> Tuple[Any, ...]:
+  return result['p'], result['q'], result['layers'], result['size'], result['backend'], result['stage']
+
+# descriptions of the results that are slower or larger than in the baseline
+def regressions(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float = TOLERANCE) -> List[str]:
+  previous = {key(result): result for result in baseline}
+  found = []
+  for result in results:
+    old = previous.get(key(result))
+    if not old: continue
+    name = '{{{p},{q}}} layers {layers} size {size} {backend} {stage}'.format(**result)
+    if result['seconds'] > old['seconds'] * (1 + tolerance) and result['seconds'] - old['seconds'] > MIN_SECONDS:
+      found.append(f"{name}: {old['seconds']:.3f}s -> {result['seconds']:.3f}s")
+    if result['peak_rss'] > old['peak_rss'] * (1 + tolerance):
+      found.append(f"{name}: {old['peak_rss'] / 2 ** 20:.1f}MiB -> {result['peak_rss'] / 2 ** 20:.1f}MiB")
+  return found
+
+def format_result(result: Dict[str, Any]) -> str:
+  tiling = '{{{p},{q}}}'.format(**result)
+  return f"{tiling:7} {result['layers']:6} {result['size']:5} {result['stage']:17} {result['seconds']:9.3f} {result['peak_rss'] / 2 ** 20:9.1f} {result['polys']:8} {result['points']:9} {result['polys_per_second']:11.0f} {result['points_per_second']:11.0f}"
+
+def parse_tiling(text: str) -> Tuple[int, int]:
+  p, q = text.split(',')
+  return int(p), int(q)
+
+def bench_cli(argv: List[str]) -> int:
+  parser = ArgumentParser(prog='bench.py', description='time the tiling generation, flattening and rendering stages, each in a new process, over a matrix of tilings, layers and sizes')
+  parser.add_argument('--tilings', type=parse_tiling, nargs='*', help='p,q pairs, default: 4,5 5,4 7,3 3,7 6,4', default=TILINGS)
+  parser.add_argument('--layers', type=int, nargs='*', help='layer counts, default: 2 4', default=LAYERS)
+  parser.add_argument('--sizes', type=int, nargs='*', help='image sizes in pixels, default: 400 1600', default=SIZES)
+  parser.add_argument('--stages', choices=list(STAGES), nargs='*', help='stages to time, default: all', default=list(STAGES))
+  parser.add_argument('--backend', choices=BACKENDS, help='numeric backend for the tiling generation, default: float', default='float')
+  parser.add_argument('--repeat', type=int, help='runs of each stage, the fastest is kept, default: 1', default=1)
+  parser.add_argument('--output', '-o', help='write the results as JSON to this file')
+  parser.add_argument('--baseline', help='compare with the results in this JSON file and exit with 1 on regressions')
+  parser.add_argument('--tolerance', type=float, help=f'allowed slowdown and memory growth over the baseline as a fraction, default: {TOLERANCE}', default=TOLERANCE)
+  parsed = parser.parse_args(argv)
+  if parsed.repeat < 1:
+    print('repeat must be positive')
+    return 2
+  baseline = None
+  if parsed.baseline:
+    try:
+      with open(parsed.baseline) as f:
+        baseline = load(f)['results']
+    except (OSError, ValueError, KeyError) as e:
+      print(f"Can't load baseline '{parsed.baseline}': {e}")
+      return 2
+  print('tiling  layers  size stage               seconds  peak MiB    polys    points     polys/s    points/s')
+  results = []
+  for p, q in parsed.tilings:
+    if (p - 2) * (q - 2) <= 4:
+      print(f'skipping {{{p},{q}}}: (p-2)(q-2) must be > 4')
+      continue
+    for layers in parsed.layers:
+      for size in parsed.sizes:
+        for stage in parsed.stages:
+          result = measure((p, q, layers, size, parsed.backend, stage), parsed.repeat)
+          print(format_result(result))
+          results.append(result)
+  if parsed.output:
+    with open(parsed.output, 'w') as f:
+      dump({'python': sys.version.split()[0], 'results': results}, f, indent=1)
+  if baseline is None:
+    return 0
+  found = regressions(results, baseline, parsed.tolerance)
+  for regression in found:
+    print('regression:', regression)
+  print(f'{len(found)} regressions against {parsed.baseline}')
+  return 1 if found else 0
+
+if __name__ == '__main__':
+  exit(bench_cli(sys.argv[1:]))
@@ -0,0 +1,65 @@
+import math
+from typing import Dict, Iterable, List, Tuple
+from point import Point
+from polygon import Polygon, get_lines
+import telemetry
+
+
+# The edges of a tiling found by comparing vertex coordinates, as the Klein
+# model found them before topology.Topology derived them from the tiling
+# rule. Kept to benchmark and to check Topology against, the modules of
+# tesselatepy/ have to be importable by their plain names.
+
+# Side of the cells of the vertex grid, the square root of the tolerance
+# of UniqueLines, so the vertices within tolerance of a point are in its
+# cell or the 8 neighboring ones.
+GRID_CELL = 1e-5
+
+# collects the edges of polygons added one by one
+class UniqueLines:
+  def __init__(self):
+    self.points: List[Point] = []
+    # indices of the points in each cell of the grid
+    self.grid: Dict[Tuple[int, int], List[int]] = {}
+    # undirected edges by their sorted point indices
+    self.lines: Dict[Tuple[int, int], Tuple[int, int]] = {}
+    self.total = 0
+
+  # index of the first point within tolerance, the point is added if none
+  def index(self, candidate: Point) -> int:
+    prec = 1e-10
+    points = self.points
+    cx = math.floor(float(candidate.x) / GRID_CELL)
+    cy = math.floor(float(candidate.y) / GRID_CELL)
+    found = -1
+    for x in range(cx - 1, cx + 2):
+      for y in range(cy - 1, cy + 2):
+        for i in self.grid.get((x, y), ()):
+          if (found == -1 or i < found) and points[i].minusc(candidate).norm_squared() <= prec:
+            found = i
+    if found == -1:
+      found = len(points)
+      points.append(candidate)
+      self.grid.setdefault((cx, cy), []).append(found)
+    return found
+
+  def add(self, poly: Polygon):
+    for line in get_lines(poly):
+      self.total += 2
+      a_index = self.index(line.a)
+      b_index = self.index(line.b)
+      key = (min(a_index, b_index), max(a_index, b_index))
+      telemetry.count('edges')
+      if key in self.lines:
+        telemetry.count('duplicate_edges')
+      else:
+        self.lines[key] = (a_index, b_index)
+
+  def result(self) -> List[Tuple[Point, Point]]:
+    return [(self.points[a_index], self.points[b_index]) for a_index, b_index in self.lines.values()]
+
+def get_unique_lines(polys: Iterable[Polygon]) -> List[Tuple[Point, Point]]:
+  unique = UniqueLines()
+  for poly in polys:
+    unique.add(poly)
+  return unique.result()
@@ -0,0 +1,152 @@
+import math
+import os
+from array import array
+from collections import deque
+from typing import TYPE_CHECKING, Callable, Deque, Iterator, List, Optional, Sequence, Tuple
+from PIL import Image, ImageDraw
+from poincare_disk import DiskParams, PoincareDisk, Color
+from polygon import Polygon
+from polygon_store import PolygonStore
+from point import Point
+from mobius import Mobius
+from outlines import iter_outlines
+from sprites import SpriteCache
+from tiling_cache import TilingCache
+from circular_curve import DEFAULT_FLATNESS
+from formats import ANIMATED, DEFAULT_FPS
+from main import draw_kleine_fishes, draw_outlines, save
+from render import quiet
+import telemetry
+if TYPE_CHECKING:
+  from concurrent.futures import Future
+
+# the hyperbolic distance between the centers of two neighboring polygons,
+# twice the inradius of the polygon, see construct_center_polygon
+def tile_distance(n: int, k: int) -> float:
+  return 2 * math.acosh(math.cos(math.pi / k) / math.sin(math.pi / n))
+
+# The tiling moving thru the frames of an animation: the frame i shows it
+# translated by distance * i / count against the direction, in radians, so
+# the view flies along the direction. The tiling is generated once, its
+# polygons and colors are the same in every frame and only the vertices
+# move, all at once by Mobius.apply_coords. The vertices are kept as floats
+# whatever the backend, screen precision is all a frame needs.
+class Animation:
+  def __init__(self, params: DiskParams, disk: PoincareDisk, count: int, distance: float, direction: float = 0, poincare: bool = True, fishes: Optional[List['Image.Image']] = None, flatness: Optional[float] = DEFAULT_FLATNESS, sprites: Optional[SpriteCache] = None, vectorized: bool = False):
+    self.params = params
+    self.count = count
+    self.distance = distance
+    self.direction = direction
+    self.poincare = poincare
+    self.fishes = fishes or []
+    self.flatness = flatness
+    self.sprites = sprites
+    self.vectorized = vectorized
+    store = float_store(disk.polys)
+    self.coords = store.coords
+    self.offsets = store.offsets
+    self.colors = list(disk.colors)
+    self.rule = list(disk.rule)
+    self.topology = None if poincare else disk.topology()
+
+  def transform(self, i: int) -> Mobius:
+    return Mobius.translation(self.distance * i / self.count, self.direction + math.pi)
+
+  # (index, polygon, color, rule) of the frame i, like iter_polys
+  def polys(self, i: int) -> Iterator[Tuple[int, Polygon, Color, int]]:
+    store = PolygonStore(self.transform(i).apply_coords(self.coords), self.offsets)
+    for j, poly in enumerate(store):
+      yield j, poly, self.colors[j], self.rule[j]
+
+  def draw(self, i: int) -> 'Image.Image':
+    width, height = self.params.width, self.params.height
+    if not self.poincare:
+      return draw_kleine_fishes(self.polys(i), self.topology, min(width, height), self.fishes, self.sprites, None, self.vectorized, quiet)
+    im = Image.new('RGBA', (width, height))
+    amount = len(self.offsets) - 1
+    draw_outlines(ImageDraw.Draw(im), iter_outlines(self.polys(i), width, height, flatness=self.flatness), amount, amount, log=quiet)
+    return im
+
+# the polygons with float coordinates in a store of their own, which
+# pickles for the workers unlike one mapped from a TilingCache
+def float_store(polys: Sequence[Polygon]) -> PolygonStore:
+  if not isinstance(polys, PolygonStore):
+    store = PolygonStore()
+    for poly in polys:
+      store.append([Point(float(pt.x), float(pt.y)) for pt in poly])
+    return store
+  coords = array('d')
+  coords.frombytes(memoryview(polys.coords).cast('B'))
+  offsets = array('q')
+  offsets.frombytes(memoryview(polys.offsets).cast('B'))
+  return PolygonStore(coords, offsets)
+
+# the animation drawn by a worker process, see iter_frames
+_animation: Optional[Animation] = None
+
+def _start_worker(animation: Animation):
+  global _animation
+  _animation = animation
+
+def _draw_frame(i: int) -> 'Image.Image':
+  assert _animation is not None
+  return _animation.draw(i)
+
+# Yield the frames in order. With more than one worker the frames are drawn
+# by a process pool, keeping at most two frames per worker in flight.
+def iter_frames(animation: Animation, workers: int = 1) -> Iterator['Image.Image']:
+  if workers <= 1:
+    for i in range(animation.count):
+      with telemetry.span('frame', frame=i):
+        im = animation.draw(i)
+      yield im
+    return
+  from concurrent.futures import ProcessPoolExecutor
+  with ProcessPoolExecutor(workers, initializer=_start_worker, initargs=(animation,)) as executor:
+    pending: Deque['Future'] = deque()
+    for i in range(animation.count):
+      pending.append(executor.submit(_draw_frame, i))
+      if len(pending) >= 2 * workers:
+        yield pending.popleft().result()
+    while pending:
+      yield pending.popleft().result()
+
+# Write the frames to an animated .gif or .webp, fps frames per second in
+# an endless loop, or to one numbered image per frame, i.e. fly0000.png,
+# fly0001.png, ... for fly.png. Numbered images are written as the frames
+# come; PIL keeps the frames of an animated image until it's written.
+def save_frames(frames: Iterator['Image.Image'], output: str, count: int, fps: float = DEFAULT_FPS, log: Callable[..., None] = print):
+  stem, extension = os.path.splitext(output)
+
+  def logged() -> Iterator['Image.Image']:
+    for i, im in enumerate(frames):
+      log(f'[{i + 1}/{count}] frame')
+      yield im
+
+  if extension.lower() not in ANIMATED:
+    for i, im in enumerate(logged()):
+      save(im, f'{stem}{i:04d}{extension}', show=False, log=log)
+    return
+  ims = logged()
+  first = next(ims)
+  # transparent pixels are cleared for the next frame instead of kept
+  options = {'disposal': 2} if extension.lower() == '.gif' else {}
+  with telemetry.span('encode', fname=output):
+    first.save(output, save_all=True, append_images=ims, duration=round(1000 / fps), loop=0, **options)
+
+# Draw count frames of the tiling flying the distance along the direction,
+# in degrees, and save them to output, see save_frames. The distance
+# defaults to tile_distance, after which the tiling looks the same again
+# for an even p, only the colors differ. workers draw frames in parallel.
+# With a cache the tiling is loaded from there or stored.
+def animate(params: DiskParams, output: str, count: int, distance: Optional[float] = None, direction: float = 0, poincare: bool = True, fishes: Optional[List['Image.Image']] = None, fps: float = DEFAULT_FPS, workers: int = 1, flatness: Optional[float] = DEFAULT_FLATNESS, sprites: Optional[SpriteCache] = None, vectorized: bool = False, cache: Optional[TilingCache] = None, log: Callable[..., None] = print):
+  with telemetry.span('tiling'):
+    disk = cache.get(params) if cache else PoincareDisk.new(params)
+  if cache:
+    log(cache)
+  if distance is None:
+    distance = tile_distance(params.n, params.k)
+  log(f'total polys: {len(disk.polys)}, frames: {count}, distance: {distance:.3f}')
+  animation = Animation(params, disk, count, distance, math.radians(direction), poincare, fishes, flatness, sprites, vectorized)
+  log(f'animation will be saved as: "{output}"')
+  save_frames(iter_frames(animation, workers), output, count, fps, log)
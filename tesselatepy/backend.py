@@ -0,0 +1,188 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Sequence, Tuple
+from decimal_math import Decimal, tolerance
+from point import Point
+from polygon import Polygon, construct_center_polygon, create_next_poly
+from mobius import MobiusTile, MobiusTiling
+from polygon_store import PolygonStore
+
+
+# Numeric backends used to generate the tiling.
+#   decimal: 30-digit Decimal coordinates, exact enough up to the boundary
+#   float: the same algorithms on native floats
+#   numpy: float64 arrays, every polygon of a generation reflected at once
+#   mobius: each polygon is an isometry of the center polygon, see mobius.py
+# Accuracy of the fast backends can be checked against decimal with
+# 'python cli.py --check-backend', see README.
+BACKENDS = ['decimal', 'float', 'numpy', 'mobius']
+
+class Backend(ABC):
+  name = ''
+
+  # the center polygon of a regular n-k tiling in the backend representation
+  @abstractmethod
+  def center_polygon(self, n: int, k: int) -> Any:
+    pass
+
+  # reflect the polygon p thru its side s, same as polygon.create_next_poly
+  @abstractmethod
+  def next_poly(self, p: Any, s: int, n: int) -> Any:
+    pass
+
+  # convert a polygon in the backend representation to a list of points
+  def to_polygon(self, p: Any) -> Polygon:
+    return p
+
+  # Add the polygons with the indices (in order) to polys, where polygon j
+  # is the reflection of polygon parents[j] thru its side sides[j].
+  def extend(self, polys: Dict[int, Any], parents: Dict[int, int], sides: Dict[int, int], indices: range, n: int):
+    for j in indices:
+      polys[j] = self.next_poly(polys[parents[j]], sides[j], n)
+
+  # Create all polygons of the tiling from the center polygon, where
+  # polygon j is the reflection of polygon parents[j] thru its side sides[j].
+  def generate(self, center: Any, parents: List[int], sides: List[int], n: int) -> Sequence[Polygon]:
+    polys = [center]
+    for j in range(1, len(parents)):
+      polys.append(self.next_poly(polys[parents[j]], sides[j], n))
+    store = PolygonStore()
+    for p in polys:
+      store.append(self.to_polygon(p))
+    return store
+
+class _PointBackend(Backend):
+  def __init__(self, name: str, numeric: type):
+    self.name = name
+    self.numeric = numeric
+
+  def center_polygon(self, n: int, k: int) -> Polygon:
+    return construct_center_polygon(n, k, False, self.numeric)
+
+  def next_poly(self, p: Polygon, s: int, n: int) -> Polygon:
+    return create_next_poly(p, s, n)
+
+  def generate(self, center: Any, parents: List[int], sides: List[int], n: int) -> Sequence[Polygon]:
+    # Decimal coordinates don't fit the float store
+    polys = [] if self.numeric is Decimal else PolygonStore()
+    polys.append(center)
+    for j in range(1, len(parents)):
+      polys.append(self.next_poly(polys[parents[j]], sides[j], n))
+    return polys
+
+class _NumpyBackend(Backend):
+  name = 'numpy'
+
+  def __init__(self):
+    import numpy
+    self.np = numpy
+
+  def center_polygon(self, n: int, k: int) -> Any:
+    return self.np.array([(pt.x, pt.y) for pt in construct_center_polygon(n, k, False, float)])
+
+  def next_poly(self, p: Any, s: int, n: int) -> Any:
+    return self.reflect_polys(p[None], self.np.array([s]))[0]
+
+  def to_polygon(self, p: Any) -> Polygon:
+    return [Point(x, y) for x, y in p.tolist()]
+
+  # Reflect the polygons (m, n, 2) thru their sides (m,) at once, same as
+  # polygon.create_next_poly for each of them. The line of each side is
+  # either a circle with the center c and radius r (line.CircleLine) or,
+  # if it passes thru the origin, a straight line (line._StraightLine).
+  def reflect_polys(self, polys: Any, sides: Any) -> Any:
+    np = self.np
+    m, n, _ = polys.shape
+    rows = np.arange(m)
+    a = polys[rows, sides]
+    b = polys[rows, (sides + 1) % n]
+    den = a[:, 0] * b[:, 1] - b[:, 0] * a[:, 1]
+    straight = np.abs(den) <= tolerance(0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+      s1 = (1 + (a * a).sum(axis=1)) / 2
+      s2 = (1 + (b * b).sum(axis=1)) / 2
+      c = np.stack([(s1 * b[:, 1] - s2 * a[:, 1]) / den, (a[:, 0] * s2 - b[:, 0] * s1) / den], axis=1)
+      r2 = (c * c).sum(axis=1) - 1
+      diff = polys - c[:, None]
+      factor = r2[:, None] / (diff * diff).sum(axis=2)
+      reflected = c[:, None] + factor[:, :, None] * diff
+    if straight.any():
+      p = polys[straight]
+      pa = a[straight]
+      d = b[straight] - pa
+      d /= np.sqrt((d * d).sum(axis=1))[:, None]
+      factor = 2 * ((p - pa[:, None]) * d[:, None]).sum(axis=2)
+      reflected[straight] = 2 * pa[:, None] + factor[:, :, None] * d[:, None] - p
+    q = np.empty_like(polys)
+    q[rows[:, None], (n + sides[:, None] - np.arange(n) + 1) % n] = reflected
+    return q
+
+  def extend(self, polys: Dict[int, Any], parents: Dict[int, int], sides: Dict[int, int], indices: range, n: int):
+    np = self.np
+    generation: Dict[int, int] = {}
+    batches: List[List[int]] = []
+    for j in indices:
+      generation[j] = generation.get(parents[j], -1) + 1
+      if generation[j] == len(batches):
+        batches.append([])
+      batches[generation[j]].append(j)
+    for batch in batches:
+      coords = np.stack([polys[parents[j]] for j in batch])
+      reflected = self.reflect_polys(coords, np.array([sides[j] for j in batch]))
+      for j, q in zip(batch, reflected):
+        polys[j] = q
+
+  # Polygons are created generation by generation, every generation from
+  # polygons of the previous one, so each generation is a single batch.
+  def generate(self, center: Any, parents: List[int], sides: List[int], n: int) -> Sequence[Polygon]:
+    np = self.np
+    total = len(parents)
+    generation = [0] * total
+    for j in range(1, total):
+      generation[j] = generation[parents[j]] + 1
+    generation_of = np.array(generation)
+    parents_of = np.array(parents)
+    sides_of = np.array(sides)
+    coords = np.empty((total, n, 2))
+    coords[0] = center
+    for g in range(1, max(generation) + 1):
+      batch = np.flatnonzero(generation_of == g)
+      coords[batch] = self.reflect_polys(coords[parents_of[batch]], sides_of[batch])
+    return PolygonStore.from_array(coords)
+
+# Polygons are kept as products of side reflections of the center polygon
+# and their vertices are only computed at the end. The float error of a
+# polygon grows with the number of reflections leading to it instead of
+# accumulating in the reflected coordinates.
+class _MobiusBackend(Backend):
+  name = 'mobius'
+
+  def center_polygon(self, n: int, k: int) -> MobiusTile:
+    self.tiling = MobiusTiling(construct_center_polygon(n, k, False, float))
+    return self.tiling.center_tile()
+
+  def next_poly(self, p: MobiusTile, s: int, n: int) -> MobiusTile:
+    return self.tiling.next_tile(p, s)
+
+  def to_polygon(self, p: MobiusTile) -> Polygon:
+    return self.tiling.polygon(p)
+
+def get_backend(name: str) -> Backend:
+  if name == 'decimal':
+    return _PointBackend(name, Decimal)
+  if name == 'float':
+    return _PointBackend(name, float)
+  if name == 'numpy':
+    return _NumpyBackend()
+  if name == 'mobius':
+    return _MobiusBackend()
+  raise ValueError(f'unknown backend: {name}, expected one of: {", ".join(BACKENDS)}')
+
+# Maximum distance between corresponding vertices of two tilings of the same
+# parameters, in disk units and in pixels for the given image size.
+def max_deviation(reference: Sequence[Polygon], other: Sequence[Polygon], size: int) -> Tuple[float, float]:
+  result = 0.0
+  for ref_poly, poly in zip(reference, other):
+    for a, b in zip(ref_poly, poly):
+      deviation = abs(complex(float(a.x) - float(b.x), float(a.y) - float(b.y)))
+      result = max(result, deviation if deviation == deviation else float('inf'))
+  return result, result * size / 2
@@ -1,7 +1,14 @@
-from decimal_math import Decimal, cos, sin
+import math
+from decimal_math import Decimal, cos, sin, num_like
 from scl import Scl
 from point import Point
-from random import random
+from random import Random, random
+from typing import Optional
+import telemetry
+
+
+# maximum distance in pixels between an arc and its flattened polygon
+DEFAULT_FLATNESS = 0.25
 
 
 class CircularCurve:
@@ -26,38 +33,67 @@ class CircularCurve:
     return round(self.y_center + self.radius * self.y(t))
   
   def screen(self, t: Decimal) -> Point:
-    return Point(Decimal(self.x_screen(t)), Decimal(self.y_screen(t)))
+    return Point(num_like(t, self.x_screen(t)), num_like(t, self.y_screen(t)))
 
   # Determine if a curve between t=a and t=b is bent at t=c.
   # Say it is if C is outside a narrow ellipse.
-  # If it is bent there, subdivide the interval.
-  def bent(self, at: Decimal, bt: Decimal, ct: Decimal, scl: Scl) -> Scl:
+  # If it is bent there, subdivide the interval. depth counts the
+  # subdivisions above.
+  def bent(self, at: Decimal, bt: Decimal, ct: Decimal, scl: Scl, depth: int = 0, rng: Optional[Random] = None) -> Scl:
     a = self.screen(at)
     b = self.screen(bt)
     c = self.screen(ct)
     excess = a.minusc(c).norm() + b.minusc(c).norm() - a.minusc(b).norm()
     if excess > 0.01:
-      scl = self.interpolate(scl, at, ct)
-      scl = self.interpolate(scl, ct, bt)
+      telemetry.count('bent_subdivisions')
+      telemetry.maximum('bent_depth', depth + 1)
+      self.interpolate(scl, at, ct, depth + 1, rng)
+      self.interpolate(scl, ct, bt, depth + 1, rng)
+    return scl
+
+  # Add to the list the coordinates of the curve strictly between t=a and
+  # t=b. The arc is split into the fewest equal segments whose sagitta
+  # R(1 - cos(step/2)) stays within flatness pixels, R being the screen
+  # radius, and the points are produced by rotating the radius vector one
+  # step at a time. Only screen precision is needed, so it runs on floats.
+  def flatten(self, scl: Scl, at: Decimal, bt: Decimal, flatness: float) -> Scl:
+    radius = float(self._r) * self.radius
+    sweep = float(bt - at)
+    if radius <= flatness:
+      return scl
+    # 2 acos(1 - f/R) written so it doesn't round to 0 for huge radii
+    segments = math.ceil(abs(sweep) / (4 * math.asin(math.sqrt(flatness / (2 * radius)))))
+    if segments < 2:
+      return scl
+    step = sweep / segments
+    cos_step, sin_step = math.cos(step), math.sin(step)
+    r = float(self._r)
+    cx = self.x_center + self.radius * float(self._x)
+    cy = self.y_center + self.radius * float(self._y)
+    vx = r * math.cos(float(at)) * self.radius
+    vy = r * math.sin(float(at)) * self.radius
+    for _ in range(segments - 1):
+      vx, vy = vx * cos_step - vy * sin_step, vx * sin_step + vy * cos_step
+      scl.append(round(cx + vx), round(cy + vy))
     return scl
 
   # Add to the list the coordinates of the curve (f(t),g(t)) for t
   # between a and b. It is assumed that the point (f(a),g(a)) is
   # already on the list. Enough points will be interpolated between a
   # and b so that the approximating polygon looks like the curve.
-  # The last point to be included will be (f(b),g(b)).
-  def interpolate(self, scl: Scl, at: Decimal, bt: Decimal) -> Scl:
+  # The last point to be included will be (f(b),g(b)). The random points
+  # come from rng if given, else from the random module.
+  def interpolate(self, scl: Scl, at: Decimal, bt: Decimal, depth: int = 0, rng: Optional[Random] = None) -> Scl:
+    # it was bent if points were added
+    size = len(scl)
     # first try bending it at the midpoint
-    result = self.bent(at, bt, (at + bt) / Decimal(2), scl)
-    if result != scl: return result
+    self.bent(at, bt, (at + bt) / 2, scl, depth, rng)
+    if len(scl) != size: return scl
     # now try 4 random points
     for i in range(4):
-      t = Decimal(random())
-      result = self.bent(at, bt, t * at + (Decimal(1) - t) * bt, scl)
-      if result != scl: return result
+      t = num_like(at, rng.random() if rng else random())
+      self.bent(at, bt, t * at + (1 - t) * bt, scl, depth, rng)
+      if len(scl) != size: return scl
     # it's a straight line
-    b1 = self.x_screen(bt)
-    b2 = self.y_screen(bt)
-    if scl.x != b1 or scl.y != b2:
-      scl = Scl(scl, b1, b2)
+    scl.append(self.x_screen(bt), self.y_screen(bt))
     return scl
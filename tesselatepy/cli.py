@@ -1,22 +1,74 @@
 from argparse import ArgumentParser
 from sys import argv as sys_argv
 from poincare_disk import DiskParams
-from typing import List, Optional
-from PIL import Image
-from main import main
+from typing import IO, TYPE_CHECKING, Any, Callable, List, Optional
+from backend import BACKENDS, get_backend
+from plan import plan_cli
+from circular_curve import DEFAULT_FLATNESS
+from formats import ANIMATED, DEFAULT_FPS, VECTOR_FORMATS
+from sprites import SpriteCache, DEFAULT_STEP, DEFAULT_ANGLE_STEP, DEFAULT_BUDGET
+from telemetry import tracing, open_trace
+from contextlib import nullcontext
+if TYPE_CHECKING:
+  from PIL import Image
+  from tiling_cache import TilingCache
 
 
+# PIL, drawing and the optional stages are imported by the runs using them,
+# 'cli.py plan' doesn't load them
+def load_image(path: str) -> 'Image':
+  from PIL import Image
+  return Image.open(path).convert('RGBA')
+
+class ParseExit(Exception):
+  pass
+
+# Reports errors and --help to log and raises ParseExit instead of exiting,
+# for parsing arguments in a process that keeps running.
+class LoggingParser(ArgumentParser):
+  def __init__(self, log: Callable[..., None], **kwargs: Any):
+    super().__init__(**kwargs)
+    self.log = log
+
+  def print_usage(self, file: Optional[IO[str]] = None):
+    self.log(self.format_usage().strip())
+
+  def print_help(self, file: Optional[IO[str]] = None):
+    self.log(self.format_help().strip())
+
+  def exit(self, status: int = 0, message: Optional[str] = None):
+    if message:
+      self.log(message.strip())
+    raise ParseExit(status)
+
 class Args:
-  def __init__(self, params: DiskParams, fishes: List['Image'], output: str, poincare: bool):
+  def __init__(self, params: DiskParams, fishes: List['Image'], output: str, poincare: bool, check_backend: bool = False, workers: int = 1, flatness: Optional[float] = DEFAULT_FLATNESS, sprites: Optional[SpriteCache] = None, symmetric: bool = False, block: int = 0, min_size: float = 0, inverse: bool = False, vectorized: bool = False, trace: Optional[str] = None, cache: Optional['TilingCache'] = None, animate: int = 0, distance: Optional[float] = None, direction: float = 0, fps: float = DEFAULT_FPS):
     self.params = params
     self.fishes = fishes
     self.output = output
     self.poincare = poincare
+    self.check_backend = check_backend
+    self.workers = workers
+    self.flatness = flatness
+    self.sprites = sprites
+    self.symmetric = symmetric
+    self.block = block
+    self.min_size = min_size
+    self.inverse = inverse
+    self.vectorized = vectorized
+    self.trace = trace
+    self.cache = cache
+    self.animate = animate
+    self.distance = distance
+    self.direction = direction
+    self.fps = fps
 
+  # With exit_on_error off, errors and --help go to log and None is returned.
   @staticmethod
-  def parse(argv: List[str]) -> Optional['Args']:
-    parser = ArgumentParser()
-    parser.add_argument('--output', '-o', help='output image filename, i.e "tesselation.png"', required=True)
+  def parse(argv: List[str], log: Callable[..., None] = print, load: Callable[[str], 'Image'] = load_image, exit_on_error: bool = True) -> Optional['Args']:
+    epilog = "run 'cli.py plan --help' to estimate polygon counts, memory and time of a tiling, 'cli.py serve --help' to keep rendering from one process"
+    parser = ArgumentParser(epilog=epilog) if exit_on_error else LoggingParser(log, epilog=epilog)
+    parser.add_argument('--output', '-o', help='output image filename, i.e "tesselation.png"')
     parser.add_argument('--color', '-c', nargs='*', help='face colors, i.e "#3d3d3d #f00 black"; if none given random colors will be used')
     parser.add_argument('--poincare', help='draw poincare model instead of Klein', action='store_true')
     parser.add_argument('--layers', type=int, help='algorithm recursion depth, default: 4', default=4)
@@ -24,42 +76,162 @@ class Args:
     parser.add_argument('--edge', '-e', nargs='*', help='image filename, that will be used randomly on edges')
     parser.add_argument('--vertices', '-p', type=int, help='number of vertices of each polygon, (p-2)(q-2) must be > 4', required=True)
     parser.add_argument('--adjacency', '-q', type=int, help='number of polygons adjacent to each vertex, (p-2)(q-2) must be > 4', required=True)
-    parsed = parser.parse_args(argv)
+    parser.add_argument('--backend', choices=BACKENDS, help='numeric backend for the tiling generation, default: decimal', default='decimal')
+    parser.add_argument('--workers', type=int, help='processes drawing the poincare model outlines, default: 1', default=1)
+    parser.add_argument('--flatness', type=float, help='max distance in pixels between the poincare model arcs and their outlines, 0 for the old random subdivision, default: 0.25', default=DEFAULT_FLATNESS)
+    parser.add_argument('--symmetric', help='draw one of the p rotationally symmetric sectors of the poincare model and rotate it into the others, for an even q only', action='store_true')
+    parser.add_argument('--inverse', help='draw the poincare model per pixel by reflecting every pixel into the center polygon, up to the boundary regardless of --layers; needs numpy', action='store_true')
+    parser.add_argument('--min-size', type=float, help='poincare model polygons smaller than this many pixels are drawn as a pixel and polygons with only smaller descendants aren\'t generated, so --layers can be set high, default: 0 (off)', default=0)
+    parser.add_argument('--block', type=int, help='render the image in blocks of this many pixels thru a temporary file instead of in memory, for very large sizes, default: 0 (off)', default=0)
+    parser.add_argument('--sprite-step', type=int, help='klein model edge images are resized in steps of this many pixels and reused, default: 1', default=DEFAULT_STEP)
+    parser.add_argument('--sprite-angle-step', type=float, help='klein model edge images are rotated in steps of this many degrees and reused, 0 for exact angles, default: 0.5', default=DEFAULT_ANGLE_STEP)
+    parser.add_argument('--sprite-cache', type=float, help='memory for reused klein model edge images in MiB, default: 64', default=DEFAULT_BUDGET / 2 ** 20)
+    parser.add_argument('--vectorized', help='composite the klein model edge images with numpy in batches instead of pasting them one by one, not with --block', action='store_true')
+    parser.add_argument('--cache', help='folder keeping generated tilings for later runs of the same p, q, layers and backend')
+    parser.add_argument('--cache-size', type=float, help='disk space of the --cache folder in MiB, the least recently used tilings are deleted beyond it, default: 512')
+    parser.add_argument('--animate', type=int, help='draw this many frames of the tiling flying along --direction into a .gif, a .webp or numbered images; needs numpy, default: 0 (off)', default=0)
+    parser.add_argument('--distance', type=float, help='hyperbolic distance --animate flies, default: between the centers of neighboring polygons')
+    parser.add_argument('--direction', type=float, help='direction --animate flies in degrees, 0 is to the right, default: 0', default=0)
+    parser.add_argument('--fps', type=float, help=f'frames per second of an animated .gif or .webp, default: {DEFAULT_FPS}', default=DEFAULT_FPS)
+    parser.add_argument('--trace', help='write stage timings, counters and progress to this file, as JSON lines for .jsonl and as a Chrome trace (chrome://tracing, Perfetto) otherwise')
+    parser.add_argument('--check-backend', help='compare the tiling of --backend with the decimal one and exit', action='store_true')
+    try:
+      parsed = parser.parse_args(argv)
+    except ParseExit:
+      return None
     p = parsed.vertices
     q = parsed.adjacency
     fst_image = None
     images = []
     allowed_extensions = ['.png', '.jpg', '.bmp']
+    try:
+      get_backend(parsed.backend)
+    except ImportError as e:
+      log(f"Backend '{parsed.backend}' is not available: {e}")
+      return None
+    if (p - 2) * (q - 2) <= 4:
+      log('(p-2)(q-2) must be > 4')
+      return None
+    if parsed.check_backend:
+      params = DiskParams(p, q, parsed.layers, parsed.size, parsed.color, parsed.backend)
+      return Args(params, [], parsed.output, parsed.poincare, True)
+    if parsed.symmetric and not parsed.poincare:
+      log('--symmetric requires the poincare model')
+      return None
+    if parsed.symmetric and q % 2:
+      log('--symmetric requires an even q, with an odd q neighbors across the sectors would get the same colors')
+      return None
+    if parsed.inverse:
+      if not parsed.poincare:
+        log('--inverse requires the poincare model')
+        return None
+      if parsed.block or parsed.symmetric or parsed.workers > 1 or parsed.min_size:
+        log('--inverse draws every pixel in memory, it can\'t be combined with --block, --symmetric, --workers or --min-size')
+        return None
+      try:
+        import numpy
+      except ImportError as e:
+        log(f'--inverse is not available: {e}')
+        return None
+    if parsed.vectorized:
+      if parsed.poincare or parsed.block:
+        log('--vectorized requires the Klein model drawn in memory')
+        return None
+      try:
+        import numpy
+      except ImportError as e:
+        log(f'--vectorized is not available: {e}')
+        return None
+    if parsed.min_size and not parsed.poincare:
+      log('--min-size requires the poincare model')
+      return None
+    if parsed.block < 0:
+      log('block size must not be negative')
+      return None
+    if parsed.flatness < 0:
+      log('flatness must not be negative')
+      return None
+    if parsed.sprite_step < 1 or parsed.sprite_angle_step < 0:
+      log('sprite steps must be positive')
+      return None
+    if not parsed.output:
+      log('output filename is required')
+      return None
     if not parsed.poincare and not parsed.edge:
-      print('Klein model requires edge images')
+      log('Klein model requires edge images')
       return None
+    if parsed.animate:
+      if parsed.animate < 0 or parsed.fps <= 0:
+        log('frames and fps must be positive')
+        return None
+      if parsed.symmetric or parsed.inverse or parsed.min_size or parsed.block:
+        log('--animate can\'t be combined with --symmetric, --inverse, --min-size or --block')
+        return None
+      try:
+        import numpy
+      except ImportError as e:
+        log(f'--animate is not available: {e}')
+        return None
+      allowed_extensions = allowed_extensions + ANIMATED
+    if any(map(parsed.output.endswith, VECTOR_FORMATS)):
+      if not parsed.poincare or parsed.symmetric or parsed.inverse or parsed.block or parsed.animate:
+        log('.svg and .pdf output require the poincare model without --symmetric, --inverse, --block or --animate')
+        return None
+      allowed_extensions = allowed_extensions + VECTOR_FORMATS
     if not any(map(parsed.output.endswith, allowed_extensions)):
-      print('output filename should have one of these extensions:', ', '.join(allowed_extensions))
-      return None
-    if (p - 2) * (q - 2) <= 4:
-      print('(p-2)(q-2) must be > 4')
+      log('output filename should have one of these extensions:', ', '.join(allowed_extensions))
       return None
     for edge in parsed.edge or []:
       try:
-        image = load_image(edge)
+        image = load(edge)
         if not fst_image:
           fst_image = image
         if image.size != fst_image.size:
-          print('All edge images must be equal size')
+          log('All edge images must be equal size')
           return None
         images.append(image)
       except Exception as e:
-        print(f"Can't load image '{edge}': {e}")
+        log(f"Can't load image '{edge}': {e}")
         return None
-    params = DiskParams(p, q, parsed.layers, parsed.size, parsed.color)
-    return Args(params, images, parsed.output, parsed.poincare)
+    cache = None
+    if parsed.cache:
+      try:
+        from tiling_cache import TilingCache, DEFAULT_CACHE_BUDGET
+        budget = DEFAULT_CACHE_BUDGET if parsed.cache_size is None else int(parsed.cache_size * 2 ** 20)
+        cache = TilingCache(parsed.cache, budget)
+      except OSError as e:
+        log(f"Can't use cache folder '{parsed.cache}': {e}")
+        return None
+    params = DiskParams(p, q, parsed.layers, parsed.size, parsed.color, parsed.backend)
+    sprites = SpriteCache(parsed.sprite_step, parsed.sprite_angle_step, int(parsed.sprite_cache * 2 ** 20))
+    return Args(params, images, parsed.output, parsed.poincare, workers=parsed.workers, flatness=parsed.flatness or None, sprites=sprites, symmetric=parsed.symmetric, block=parsed.block, min_size=parsed.min_size, inverse=parsed.inverse, vectorized=parsed.vectorized, trace=parsed.trace, cache=cache, animate=parsed.animate, distance=parsed.distance, direction=parsed.direction, fps=parsed.fps)
 
-def load_image(path: str) -> 'Image':
-  return Image.open(path).convert('RGBA')
+# Draw what args ask for, messages go to log. show is off for running
+# headless.
+def run(args: Args, log: Callable[..., None] = print, show: bool = True):
+  if args.check_backend:
+    from main import check_backend
+    check_backend(args.params)
+    return
+  with tracing(open_trace(args.trace)) if args.trace else nullcontext():
+    if any(map(args.output.endswith, VECTOR_FORMATS)):
+      from vector import write_vector
+      write_vector(args.params, args.output, args.min_size, args.cache, log)
+    elif args.animate:
+      from animation import animate
+      animate(args.params, args.output, args.animate, args.distance, args.direction, args.poincare, args.fishes, args.fps, args.workers, args.flatness, args.sprites, args.vectorized, args.cache, log)
+    else:
+      from main import main
+      main(args.params, args.fishes, args.output, args.poincare, args.workers, args.flatness, args.sprites, args.symmetric, args.block, args.min_size, args.inverse, args.vectorized, show, args.cache, log)
 
 if __name__ == '__main__':
+  if sys_argv[1:2] == ['plan']:
+    exit(0 if plan_cli(sys_argv[2:]) else 1)
+  if sys_argv[1:2] == ['serve']:
+    # the server imports this module
+    from server import serve_cli
+    exit(0 if serve_cli(sys_argv[2:]) else 1)
   args = Args.parse(sys_argv[1:])
   if not args:
     exit(1)
-  else:
-    main(args.params, args.fishes, args.output, args.poincare)
+  run(args)
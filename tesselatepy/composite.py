@@ -0,0 +1,123 @@
+from typing import Any, List, Tuple
+from PIL import Image
+
+
+# samples of edge image pixels blended at once
+MAX_SAMPLES = 1 << 20
+
+# Paste the edge images along the lines onto the RGBA image like
+# draw_kleine_fishes does with Image.paste, one batch of lines at a time
+# instead of one line: the bounding box pixels of every line of a batch are
+# mapped back into its edge image in one affine pass for each edge image,
+# and blended in line order. The edge image spans the line lengthwise from
+# start to end and is length / aspect thick. starts and ends are (m, 2)
+# screen coordinates, choices the edge image index of each line. Edge
+# images are shrunk in steps of 2 beforehand for short lines. Returns
+# (line index, reason) for each line that was skipped.
+def composite_lines(im: 'Image.Image', starts: Any, ends: Any, fishes: List['Image.Image'], choices: Any) -> List[Tuple[int, str]]:
+  import numpy as np
+  width, height = im.size
+  canvas = np.array(im.convert('RGBA')).reshape(-1, 4)
+  aspect = fishes[0].size[0] / fishes[0].size[1]
+  levels = [mip_levels(np, fish) for fish in fishes]
+  start = np.asarray(starts, dtype=np.float64)
+  end = np.asarray(ends, dtype=np.float64)
+  length = np.hypot(*(end - start).T)
+  thickness = length / aspect
+  skipped = [(int(i), 'not finite') for i in np.flatnonzero(~np.isfinite(length))]
+  valid = np.isfinite(length)
+  # unit vectors along the line and across it, see Image.rotate
+  along = np.zeros_like(start)
+  along[valid] = (end - start)[valid] / length[valid, None]
+  across = np.stack([-along[:, 1], along[:, 0]], axis=1)
+  middle = (start + end) / 2
+  half = np.abs(along) * length[:, None] / 2 + np.abs(across) * thickness[:, None] / 2
+  x0 = np.clip(np.floor(middle[:, 0] - half[:, 0]), 0, width)
+  y0 = np.clip(np.floor(middle[:, 1] - half[:, 1]), 0, height)
+  x1 = np.clip(np.ceil(middle[:, 0] + half[:, 0]), 0, width)
+  y1 = np.clip(np.ceil(middle[:, 1] + half[:, 1]), 0, height)
+  x0[~valid] = x1[~valid] = y0[~valid] = y1[~valid] = 0
+  box_width = (x1 - x0).astype(np.int64)
+  box_height = (y1 - y0).astype(np.int64)
+  areas = box_width * box_height
+  skipped += [(int(i), 'outside the image') for i in np.flatnonzero(valid & (areas == 0))]
+  # the mip level of each line, halving the edge image while it's still
+  # at least twice the line length
+  choices = np.asarray(choices, dtype=np.int64)
+  scale = np.array([fish.size[0] for fish in fishes])[choices] / np.maximum(np.nan_to_num(length), 1)
+  level = np.floor(np.log2(np.maximum(scale, 1))).astype(np.int64)
+  first = 0
+  while first < len(start):
+    # lines of the batch, at least one
+    last = first + max(1, int(np.searchsorted(np.cumsum(areas[first:]), MAX_SAMPLES)))
+    batch = np.arange(first, min(last, len(start)))
+    batch = batch[areas[batch] > 0]
+    samples = []
+    for fish in range(len(fishes)):
+      for lvl in range(len(levels[fish])):
+        lines = batch[(choices[batch] == fish) & (np.minimum(level[batch], len(levels[fish]) - 1) == lvl)]
+        if len(lines):
+          samples.append(sample(np, levels[fish][lvl], lines, x0, y0, box_width, areas, middle, along, across, length, thickness, width))
+    if samples:
+      blend(np, canvas, *(np.concatenate(parts) for parts in zip(*samples)))
+    first = last
+  im.paste(Image.fromarray(canvas.reshape(height, width, 4), 'RGBA'))
+  return skipped
+
+# the edge image as arrays (h, w, 4), halved until it's a few pixels
+def mip_levels(np: Any, fish: 'Image.Image') -> List[Any]:
+  result = [np.asarray(fish.convert('RGBA'))]
+  w, h = fish.size
+  while min(w, h) >= 4:
+    w, h = w // 2, h // 2
+    result.append(np.asarray(fish.convert('RGBA').resize((w, h), Image.LANCZOS)))
+  return result
+
+# (pixel, line, rgba) of the edge image texture over the bounding boxes of
+# the lines, nearest neighbor, transparent samples left out
+def sample(np: Any, texture: Any, lines: Any, x0: Any, y0: Any, box_width: Any, areas: Any, middle: Any, along: Any, across: Any, length: Any, thickness: Any, width: int) -> Tuple[Any, Any, Any]:
+  counts = areas[lines]
+  line = np.repeat(lines, counts)
+  offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+  row, column = np.divmod(offset, np.repeat(box_width[lines], counts))
+  # u and v as affine functions of the pixel center relative to the box
+  # corner, single precision is plenty within a box
+  th, tw = texture.shape[:2]
+  ux, uy = (along[lines] * (tw / length[lines])[:, None]).T
+  vx, vy = (across[lines] * (th / thickness[lines])[:, None]).T
+  cx, cy = (middle[lines] - 0.5 - np.stack([x0[lines], y0[lines]], axis=1)).T
+  bx = column.astype(np.float32)
+  by = row.astype(np.float32)
+  u = np.repeat((tw / 2 - ux * cx - uy * cy).astype(np.float32), counts) + np.repeat(ux.astype(np.float32), counts) * bx + np.repeat(uy.astype(np.float32), counts) * by
+  v = np.repeat((th / 2 - vx * cx - vy * cy).astype(np.float32), counts) + np.repeat(vx.astype(np.float32), counts) * bx + np.repeat(vy.astype(np.float32), counts) * by
+  inside = np.flatnonzero((u >= 0) & (u < tw) & (v >= 0) & (v < th))
+  rgba = texture[v[inside].astype(np.int64), u[inside].astype(np.int64)]
+  opaque = inside[rgba[:, 3] > 0]
+  line = line[opaque]
+  pixel = (y0[line].astype(np.int64) + row[opaque]) * width + x0[line].astype(np.int64) + column[opaque]
+  return pixel, line, rgba[rgba[:, 3] > 0]
+
+# Blend the samples into the canvas in line order the way Image.paste with
+# the edge image as the mask does: every channel, alpha too, becomes
+# source * a + canvas * (1 - a), a being the source alpha. For a pixel that
+# gets the samples 1..m it's the sum of source_i a_i prod_{j>i} (1 - a_j)
+# plus canvas prod_j (1 - a_j).
+def blend(np: Any, canvas: Any, pixel: Any, line: Any, rgba: Any):
+  # the edge images may be transparent where the lines of a batch are
+  if not len(pixel):
+    return
+  order = np.argsort(pixel * (int(line.max()) + 1) + line)
+  pixel, rgba = pixel[order], rgba[order].astype(np.float64)
+  a = rgba[:, 3] / 255
+  # log of 1 - a, bounded for opaque samples
+  keep = np.maximum(np.log1p(-np.minimum(a, 1 - 1e-12)), -60)
+  starts = np.flatnonzero(np.r_[True, pixel[1:] != pixel[:-1]])
+  group = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(pixel)]))
+  total = np.add.reduceat(keep, starts)
+  # prod_{j>i} (1 - a_j) within the group of the sample
+  running = np.cumsum(keep)
+  before = (running - keep)[starts]
+  rgba *= (a * np.exp(total[group] - (running - before[group])))[:, None]
+  unique = pixel[starts]
+  result = np.add.reduceat(rgba, starts) + canvas[unique] * np.exp(total)[:, None]
+  canvas[unique] = np.round(result)
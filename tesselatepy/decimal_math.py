@@ -1,22 +1,59 @@
 import math
-from decimal import Decimal, ExtendedContext, setcontext, getcontext
+from decimal import Context, Decimal, ExtendedContext, getcontext, localcontext
+from typing import ContextManager, Union
+import telemetry
 
 
-setcontext(ExtendedContext)
-getcontext().prec = 30
+# The context of the Decimal geometry: 30 digits, and NaN or infinity
+# instead of exceptions like ExtendedContext. It isn't set on import, the
+# entry points run in decimal_context(): drawing, generating a tiling and
+# flattening in a worker process. Other threads and other users of decimal
+# keep their own context.
+CONTEXT = ExtendedContext.copy()
+CONTEXT.prec = 30
+
+def decimal_context() -> ContextManager[Context]:
+  return localcontext(CONTEXT)
+
+# Coordinates are either Decimal (precise, slow) or float (fast), see backend.py.
+# The functions below dispatch on the type of their argument, so the geometry
+# in point.py, line.py and polygon.py runs unchanged on both.
+Number = Union[Decimal, float]
 
 pi = Decimal(math.pi)
 
-def atan2(y: Decimal, x: Decimal) -> Decimal:
-  return Decimal(math.atan2(y, x))
+# convert x to the numeric type of like
+def num_like(like: Number, x) -> Number:
+  return Decimal(x) if isinstance(like, Decimal) else float(x)
+
+# Values this close to zero are treated as zero. Floats can't represent the
+# zero exactly, i.e. the determinant of two points on a diameter, while
+# Decimal keeps the exact comparison.
+def tolerance(like: Number) -> Number:
+  return Decimal(0) if isinstance(like, Decimal) else 1e-12
+
+def atan2(y: Number, x: Number) -> Number:
+  if isinstance(x, Decimal):
+    telemetry.count('decimal_trig')
+    return Decimal(math.atan2(y, x))
+  return math.atan2(y, x)
 
-def sqrt(x: Decimal) -> Decimal:
-  return x.sqrt()
+# Rounding pushes the squared radius of the tiny circles near the boundary
+# slightly below zero on floats, they are taken as zero.
+def sqrt(x: Number) -> Number:
+  if isinstance(x, Decimal):
+    return x.sqrt()
+  return math.sqrt(x) if x > 0 else 0.0
 
-def is_nan(x: Decimal) -> bool:
-  return x.is_nan()
+def is_nan(x: Number) -> bool:
+  if isinstance(x, Decimal):
+    return x.is_nan()
+  return math.isnan(x)
 
-def cos(x: Decimal) -> Decimal:
+def cos(x: Number) -> Number:
+    if not isinstance(x, Decimal):
+      return math.cos(x)
+    telemetry.count('decimal_trig')
     getcontext().prec += 2
     i, lasts, s, fact, num, sign = 0, Decimal(0), Decimal(1), 1, Decimal(1), 1
     while s != lasts:
@@ -29,10 +66,15 @@ def cos(x: Decimal) -> Decimal:
     getcontext().prec -= 2
     return +s
 
-def copy_abs(x: Decimal) -> Decimal:
-  return x.copy_abs()
+def copy_abs(x: Number) -> Number:
+  if isinstance(x, Decimal):
+    return x.copy_abs()
+  return abs(x)
 
-def sin(x: Decimal) -> Decimal:
+def sin(x: Number) -> Number:
+    if not isinstance(x, Decimal):
+      return math.sin(x)
+    telemetry.count('decimal_trig')
     getcontext().prec += 2
     i, lasts, s, fact, num, sign = 1, Decimal(0), x, 1, x, 1
     while s != lasts:
@@ -0,0 +1,8 @@
+# Output formats, without imports so the CLI can check the output filename
+# before importing what writes it.
+
+# animated image formats, other extensions get a numbered file per frame
+ANIMATED = ['.gif', '.webp']
+DEFAULT_FPS = 25
+# written as vector graphics by vector
+VECTOR_FORMATS = ['.svg', '.pdf']
@@ -0,0 +1,92 @@
+from typing import Any
+from PIL import Image
+from PIL.ImageColor import getrgb
+from poincare_disk import DiskParams
+from polygon import construct_center_polygon
+from line import Line, CircleLine
+
+
+# Reflections after which a pixel is taken as it is, only pixels within
+# about 1e-14 of the boundary circle need more.
+MAX_REFLECTIONS = 200
+# image rows computed at once
+BAND = 256
+
+# Draw the Poincare model per pixel instead of per polygon: every pixel is
+# reflected thru the sides of the center polygon it lies beyond until it
+# falls into the center polygon. The number of reflections tells the
+# parity of the tile, which gives the same two alternating colors as
+# apply_rule for an even k. With an odd k the colors are picked from the
+# tile center instead, so tiles keep one color but the colors differ from
+# the polygon drawing. It doesn't depend on the layers, the tiling goes
+# all the way to the boundary. Needs NumPy.
+def render_inverse(params: DiskParams) -> 'Image.Image':
+  import numpy as np
+  width, height = params.width, params.height
+  x_center = width // 2
+  y_center = height // 2
+  radius = min(x_center, y_center)
+  # the sides of the center polygon are circles that don't contain it
+  center = construct_center_polygon(params.n, params.k, False, float)
+  sides = [Line.new(pt, center[(i + 1) % params.n]) for i, pt in enumerate(center)]
+  assert all(isinstance(side, CircleLine) for side in sides)
+  circles = [(complex(side.c.x, side.c.y), float(side.r) ** 2) for side in sides]
+  # the same draws as apply_rule for the center and the first polygon
+  first = params.random_color()
+  second = params.random_color()
+  if params.k % 2 == 0:
+    palette = [first, second]
+  else:
+    palette = [first] + [c for c in params.colors if c != first]
+  colors = np.array([getrgb(c)[:3] + (255,) for c in palette], dtype=np.uint8)
+  pixels = np.zeros((height, width, 4), dtype=np.uint8)
+  xs = (np.arange(width) + 0.5 - x_center) / radius
+  for top in range(0, height, BAND):
+    ys = (np.arange(top, min(top + BAND, height)) + 0.5 - y_center) / radius
+    z = xs[None, :] + 1j * ys[:, None]
+    inside = np.abs(z) < 1
+    pixels[top:top + len(ys)][inside] = colors[tile_colors(np, z[inside], circles, params.k % 2 == 0, len(colors))]
+  return Image.fromarray(pixels, 'RGBA')
+
+# Color indices of the points of the disk z. With parity the index is the
+# parity of the reflections, otherwise the tile center g(0) is tracked, g
+# being the composition of the reflections as a Mobius transformation
+# (a z + b) / (c z + d) of z or of its conjugate, see mobius.Mobius.
+def tile_colors(np: Any, z: Any, circles: Any, parity: bool, count: int) -> Any:
+  reflections = np.zeros(z.shape, dtype=np.int64)
+  if not parity:
+    a = np.ones_like(z)
+    b = np.zeros_like(z)
+    c = np.zeros_like(z)
+    d = np.ones_like(z)
+  active = np.arange(len(z))
+  for _ in range(MAX_REFLECTIONS):
+    moved = np.zeros(len(active), dtype=bool)
+    for center, r2 in circles:
+      w = z[active] - center
+      beyond = (w.real ** 2 + w.imag ** 2) < r2
+      if not beyond.any(): continue
+      rows = active[beyond]
+      # the inversion z -> center + r^2 / (z - center)'
+      z[rows] = center + r2 / w[beyond].conjugate()
+      reflections[rows] += 1
+      moved |= beyond
+      if not parity:
+        # g -> g R, R being the inversion as the matrix applied to z'
+        conj = reflections[rows] % 2 == 0
+        ra, rb, rc, rd = center, r2 - abs(center) ** 2, 1, -center.conjugate()
+        ga, gb, gc, gd = a[rows], b[rows], c[rows], d[rows]
+        # g conjugates R's coefficients if g itself is a reflection
+        ra_, rb_, rd_ = np.where(conj, np.conj(ra), ra), np.where(conj, np.conj(rb), rb), np.where(conj, np.conj(rd), rd)
+        a[rows] = ga * ra_ + gb * rc
+        b[rows] = ga * rb_ + gb * rd_
+        c[rows] = gc * ra_ + gd * rc
+        d[rows] = gc * rb_ + gd * rd_
+    active = active[moved]
+    if not len(active): break
+  if parity:
+    return reflections % 2
+  # the center polygon keeps the first color, other tiles get one by their center
+  tile = b / d
+  key = (np.round(tile.real * 1e6).astype(np.int64) * 73856093) ^ (np.round(tile.imag * 1e6).astype(np.int64) * 19349663)
+  return np.where(reflections == 0, 0, 1 + key % max(count - 1, 1)) % count
@@ -1,9 +1,10 @@
 from point import Point
+from random import Random
 from typing import Optional
-from decimal_math import Decimal, atan2, pi, sqrt, copy_abs
+from decimal_math import Decimal, atan2, pi, sqrt, copy_abs, num_like, tolerance
 from abc import ABC, abstractmethod
 from scl import Scl
-from circular_curve import CircularCurve
+from circular_curve import CircularCurve, DEFAULT_FLATNESS
 
 
 class Line(ABC):
@@ -17,15 +18,17 @@ class Line(ABC):
   def reflect(self, r: Point) -> Point:
     pass
 
-  # append screen coordinates to the list in order to draw the line
+  # append screen coordinates to the buffer in order to draw the line,
+  # arcs stay within flatness pixels or, if it's None, are subdivided
+  # recursively at random points of rng by CircularCurve.interpolate
   @abstractmethod
-  def append_scl(self, scl: Optional[Scl], width: int, height: int) -> Scl:
+  def append_scl(self, scl: Scl, width: int, height: int, flatness: Optional[float] = DEFAULT_FLATNESS, rng: Optional[Random] = None) -> Scl:
     pass
 
   @staticmethod
   def new(a: Point, b: Point) -> 'CircleLine':
     den = a.x * b.y - b.x * a.y
-    if copy_abs(den) == Decimal(0):
+    if copy_abs(den) <= tolerance(den):
       return _StraightLine(a, b)
     return CircleLine(a, b, den)
 
@@ -36,27 +39,29 @@ class _StraightLine(Line):
     super().__init__(a, b, True)
     self.p = a
     den = a.minusc(b).norm()
+    # vertices near the boundary can round to the same point on floats,
+    # the side then has no direction
+    if not den:
+      den = num_like(den, 1)
     self.d = Point((b.x - a.x) / den, (b.y - a.y) / den)
 
   def reflect(self, r: Point) -> Point:
-    factor = Decimal(2) * ((r.x - self.p.x) * self.d.x + (r.y - self.p.y) * self.d.y)
+    factor = 2 * ((r.x - self.p.x) * self.d.x + (r.y - self.p.y) * self.d.y)
     return Point(
-      Decimal(2) * self.p.x + factor * self.d.x - r.x,
-      Decimal(2) * self.p.y + factor * self.d.y - r.y
+      2 * self.p.x + factor * self.d.x - r.x,
+      2 * self.p.y + factor * self.d.y - r.y
     )
 
-  def append_scl(self, scl: Optional[Scl], width: int, height: int) -> Scl:
+  def append_scl(self, scl: Scl, width: int, height: int, flatness: Optional[float] = DEFAULT_FLATNESS, rng: Optional[Random] = None) -> Scl:
     x_center = width // 2
     y_center = height // 2
     radius = min(x_center, y_center)
     x: int = round(self.a.x * radius + x_center)
     y: int = round(self.a.y * radius + y_center)
-    if not scl or x != scl.x or y != scl.y:
-      scl = Scl(scl, x, y)
+    scl.append(x, y)
     x = round(self.b.x * radius + x_center)
     y = round(self.b.y * radius + y_center)
-    if x != scl.x or y != scl.y:
-      scl = Scl(scl, x, y)
+    scl.append(x, y)
     return scl
 
 class CircleLine(Line):
@@ -64,31 +69,35 @@ class CircleLine(Line):
 
   def __init__(self, a: Point, b: Point, den: Decimal):
     super().__init__(a, b, False)
-    s1 = (Decimal(1) + a.norm_squared()) / Decimal(2)
-    s2 = (Decimal(1) + b.norm_squared()) / Decimal(2)
+    s1 = (1 + a.norm_squared()) / 2
+    s2 = (1 + b.norm_squared()) / 2
     self.c = Point((s1 * b.y - s2 * a.y) / den, (a.x * s2 - b.x * s1) / den)
-    self.r = sqrt(self.c.norm_squared() - Decimal(1))
+    self.r = sqrt(self.c.norm_squared() - 1)
 
   def reflect(self, r: Point) -> Point:
     factor = self.r * self.r / r.minusc(self.c).norm_squared()
     return Point(self.c.x + factor * (r.x - self.c.x), self.c.y + factor * (r.y - self.c.y))
 
-  def append_scl(self, scl: Optional[Scl], width: int, height: int) -> Scl:
+  def append_scl(self, scl: Scl, width: int, height: int, flatness: Optional[float] = DEFAULT_FLATNESS, rng: Optional[Random] = None) -> Scl:
     x_center = width // 2
     y_center = height // 2
     radius = min(x_center, y_center)
     assert(not self.a.is_nan() and not self.b.is_nan())
     x: int = round(self.a.x * radius + x_center)
     y: int = round(self.a.y * radius + y_center)
-    if not scl or x != scl.x or y != scl.y:
-      scl = Scl(scl, x, y)
+    scl.append(x, y)
     alpha = atan2(self.a.y - self.c.y, self.a.x - self.c.x)
     beta = atan2(self.b.y - self.c.y, self.b.x - self.c.x)
     if copy_abs(beta-alpha) > pi:
       if beta < alpha:
-        beta += Decimal(2) * pi
+        beta += 2 * num_like(beta, pi)
       else:
-        alpha += Decimal(2) * pi
+        alpha += 2 * num_like(alpha, pi)
     curve = CircularCurve(self.c.x, self.c.y, self.r, x_center, y_center, radius)
-    scl = curve.interpolate(scl, alpha, beta)
+    if flatness is None:
+      return curve.interpolate(scl, alpha, beta, rng=rng)
+    scl = curve.flatten(scl, alpha, beta, flatness)
+    x = round(self.b.x * radius + x_center)
+    y = round(self.b.y * radius + y_center)
+    scl.append(x, y)
     return scl
@@ -1,48 +1,30 @@
-from poincare_disk import PoincareDisk, DiskParams
-from polygon import get_scl, Polygon, get_lines
+from array import array
+from poincare_disk import PoincareDisk, DiskParams, Color, iter_polys, count_polys, make_topology
+from backend import max_deviation
+from polygon_store import coordinates
+from outlines import iter_outlines, iter_symmetric_outlines
+from topology import Topology
+from sprites import SpriteCache
+from circular_curve import DEFAULT_FLATNESS
+from polygon import Polygon
 from point import Point
 from PIL import Image
 from PIL import ImageDraw
 from PIL.ImageOps import invert
 from time import monotonic
-from typing import List, Tuple, Optional, Set, cast
-from decimal_math import Decimal, pi, atan2, sqrt
+from typing import TYPE_CHECKING, Callable, Iterable, List, Tuple, Optional, Union
+from decimal_math import pi, atan2, num_like, decimal_context
 from random import choice
+import telemetry
+# tiles, tiling_cache, composite and inverse are imported by the stages
+# using them, a one-shot run starts faster without them
+if TYPE_CHECKING:
+  from tiles import TiledCanvas
+  from tiling_cache import TilingCache
 
 
-def is_similar_line_nondirectional(a: Tuple[Point, Point], b: Tuple[Point, Point]) -> bool:
-  a0, a1 = a
-  b0, b1 = b
-  return max(a0.minusc(b0).norm_squared(), a1.minusc(b1).norm_squared()) < 1e-10
-
-def is_similar_line(a: Tuple[Point, Point], b: Tuple[Point, Point]) -> bool:
-  b0, b1 = b
-  return is_similar_line_nondirectional(a, b) or is_similar_line_nondirectional(a, (b1, b0))
-
-def get_unique_lines(polys: List[Polygon]) -> List[Tuple[Point, Point]]:
-  points: List[Point] = []
-  lines: Set[Tuple[int, int]] = set()
-  total = 0
-  prec = 1e-10
-  for poly in polys:
-    for line in get_lines(poly):
-      ln = []
-      total += 2
-      for candidate in [line.a, line.b]:
-        index = next((i for i, pt in enumerate(points) if pt.minusc(candidate).norm_squared() <= prec), -1)
-        if index == -1:
-          index = len(points)
-          points.append(candidate)
-        ln.append(index)
-      lines.add(cast(Tuple[int, int], tuple(ln)))
-  result: List[Tuple[Point, Point]] = []
-  unique_lines: Set[Tuple[int, int]] = set()
-  for (a_index, b_index) in lines:
-    if (b_index, a_index) in unique_lines: continue
-    unique_lines.add((a_index, b_index))
-    pair = points[a_index], points[b_index]
-    result.append(pair)
-  return result
+# polygons drawn between progress events, see telemetry.progress
+PROGRESS_POLYS = 1024
 
 def invert_image(image: Image) -> Image:
   if image.mode == 'RGBA':
@@ -59,82 +41,213 @@ def monochrome(image: Image) -> Image:
   r2, g2, b2 = image.convert('1').convert('RGB').split()
   return Image.merge('RGBA', (r2, g2, b2, a))
 
-def show_kleine_fishes(disk: PoincareDisk, size: int, fishes: List['Image'], fname: str):
+# polys are (index, polygon, color, rule) as from iter_polys or
+# PoincareDisk.iter_polys, only the edges are kept once drawn, each with
+# the polygon of the lowest index as told by the topology of the tiling.
+# The edges are drawn shortest first over the whole tiling, so their ends
+# are kept for all of them, as floats in one array.
+# With a canvas the drawing is recorded there and rendered by blocks.
+# vectorized composites the edge images with NumPy, see composite_lines.
+# Returns the Klein model, the messages go to log.
+def draw_kleine_fishes(polys: Iterable[Tuple[int, Polygon, Color, int]], topology: Topology, size: int, fishes: List['Image'], sprites: Optional[SpriteCache] = None, canvas: Optional['TiledCanvas'] = None, vectorized: bool = False, log: Callable[..., None] = print) -> Union['Image', 'TiledCanvas']:
+  sprites = sprites or SpriteCache()
   hs = size // 2
-  offset = Point(Decimal(hs), Decimal(hs))
-  im = Image.new('RGBA', (size, size))
+  offset = Point(hs, hs)
+  im = canvas or Image.new('RGBA', (size, size))
   fish = fishes[0]
-  fish_aspect = Decimal(fish.size[0] / fish.size[1])
-  draw = ImageDraw.Draw(im)
-  for poly, color in zip(disk.polys, disk.colors):
-    pts = [p.times(Decimal(hs)).plusc(offset) for p in poly]
-    pil_pts = [(pt.x, pt.y) for pt in pts]
-    draw.polygon(pil_pts, fill=color)
-  print('getting unique lines...')
-  lines = get_unique_lines(disk.polys)
-  lines.sort(key=lambda a: a[0].minusc(a[1]).norm_squared())
-  print('sorting...')
-  for i, line in enumerate(lines):
-    a, b = line
-    start = a.times(Decimal(hs)).plusc(offset)
-    end = b.times(Decimal(hs)).plusc(offset)
-    # https://stackoverflow.com/a/1937202
-    se = start.minusc(end)
-    linelength = se.norm()
-    angle = atan2(se.y, se.x)
-    angle_deg = angle / pi * Decimal(180)
-    thickness = linelength / fish_aspect
-    if min(linelength, thickness) < 1: continue
-    new_fish = choice(fishes)
-    new_fish = new_fish.resize((linelength, thickness), Image.ANTIALIAS).rotate(180 - float(angle_deg), expand=True)
-    ax, ay = 0, 0
-    fx, fy = new_fish.size
-    dx, dy = min(start.x, end.x), min(start.y, end.y)
-    px = Decimal(-0.5) * thickness * (se.y / linelength)
-    py = Decimal(0.5) * thickness * (se.x / linelength)
-    dx = min(start.x + px, end.x + px, end.x - px, start.x - px)
-    dy = min(start.y + py, end.y + py, end.y - py, start.y - py)
-    # continue
-    # draw.polygon([(dx, dy), (dx + fx, dy), (dx + fx, dy + fy), (dx, dy + fy)], outline='blue')
-    try:
-      im.paste(new_fish, (dx, dy), new_fish)
-    except: continue
-    r = 5
-    # draw.ellipse((dx - r, dy - r, dx + r, dy + r), fill='red')
-  print(f'Kleine model will be saved as: "{fname}"')
+  fish_aspect = fish.size[0] / fish.size[1]
+  draw = canvas or ImageDraw.Draw(im)
+  n = topology.n
+  # x, y of the start and the end of each line
+  ends = array('d')
+  with telemetry.span('polygons'):
+    for i, poly, color, _ in polys:
+      pts = coordinates(poly)
+      pil_pts = [(x * hs + hs, y * hs + hs) for x, y in pts]
+      with telemetry.timer('draw'):
+        draw.polygon(pil_pts, fill=color)
+      for s in range(n):
+        telemetry.count('edges')
+        if topology.owns(i, s):
+          ends.extend(map(float, pts[s] + pts[(s + 1) % n]))
+        else:
+          telemetry.count('duplicate_edges')
+  count = len(ends) // 4
+  order = sorted(range(count), key=lambda j: (ends[4 * j] - ends[4 * j + 2]) ** 2 + (ends[4 * j + 1] - ends[4 * j + 3]) ** 2)
+  log('sorting...')
+  telemetry.progress('lines', 0, count)
+  # (line index, reason) of the lines that couldn't be drawn
+  skipped: List[Tuple[int, str]] = []
+  if vectorized:
+    with telemetry.span('composite', lines=count):
+      skipped = composite_klein_lines(im, ends, order, hs, fishes, fish_aspect)
+  else:
+    with telemetry.span('paste', lines=count):
+      for i, j in enumerate(order):
+        start = Point(ends[4 * j], ends[4 * j + 1]).times(hs).plusc(offset)
+        end = Point(ends[4 * j + 2], ends[4 * j + 3]).times(hs).plusc(offset)
+        # https://stackoverflow.com/a/1937202
+        se = start.minusc(end)
+        linelength = se.norm()
+        angle = atan2(se.y, se.x)
+        angle_deg = angle / num_like(angle, pi) * 180
+        thickness = linelength / num_like(linelength, fish_aspect)
+        if min(linelength, thickness) < 1: continue
+        new_fish = sprites.get(choice(fishes), linelength, thickness, 180 - float(angle_deg))
+        px = num_like(thickness, -0.5) * thickness * (se.y / linelength)
+        py = num_like(thickness, 0.5) * thickness * (se.x / linelength)
+        dx = min(start.x + px, end.x + px, end.x - px, start.x - px)
+        dy = min(start.y + py, end.y + py, end.y - py, start.y - py)
+        try:
+          im.paste(new_fish, (int(dx), int(dy)), new_fish)
+        except (ValueError, OverflowError) as e:
+          skipped.append((i, str(e)))
+  telemetry.progress('lines', count, count)
+  telemetry.count('skipped_lines', len(skipped))
+  if skipped:
+    log(f'skipped lines: {len(skipped)}, first: ' + ', '.join(f'{i} ({reason})' for i, reason in skipped[:5]))
+  if not vectorized:
+    log(sprites)
+  return im
+
+# The lines of ends in the given order in screen coordinates with the edge
+# image drawn for each one, the ones shorter or thinner than a pixel left
+# out like by the paste loop of draw_kleine_fishes, and composited all at
+# once.
+def composite_klein_lines(im: 'Image', ends: array, order: List[int], hs: int, fishes: List['Image'], fish_aspect: float) -> List[Tuple[int, str]]:
+  import numpy as np
+  from composite import composite_lines
+  lines = np.frombuffer(ends, dtype=np.float64).reshape(-1, 2, 2)[order] * hs + hs
+  length = np.hypot(*(lines[:, 0] - lines[:, 1]).T)
+  # NaN lengths are kept so they are reported
+  drawn = np.flatnonzero(~(np.minimum(length, length / fish_aspect) < 1))
+  choices = [choice(range(len(fishes))) for _ in drawn]
+  skipped = composite_lines(im, lines[drawn, 0], lines[drawn, 1], fishes, choices)
+  return [(int(drawn[i]), reason) for i, reason in skipped]
+
+# show the image unless it's rendered by blocks, too large to show, or show
+# is off for running headless. The messages go to log.
+def save(im: Union['Image', 'TiledCanvas'], fname: str, show: bool = True, log: Callable[..., None] = print):
+  if not isinstance(im, Image.Image):
+    log('rendering blocks...')
+    with telemetry.span('encode', fname=fname):
+      im.save(fname)
+    return
   if fname.endswith('.jpg'):
     im = im.convert('RGB')
-  im.save(fname)
-  im.show()
+  if show:
+    im.show()
+  with telemetry.span('encode', fname=fname):
+    im.save(fname)
 
-def main(params: DiskParams, fishes: List['Image'], output: str, poincare: bool):
-  disk = PoincareDisk.new(params)
-  im = Image.new('RGBA', (params.width, params.height))
-  draw = ImageDraw.Draw(im)
+# With symmetric only one of the n sectors of the poincare model is generated
+# and flattened, and its outlines are rotated into the others. With a block
+# size the image is rendered by blocks thru a memory mapped file, see
+# TiledCanvas. Poincare model polygons smaller than min_size pixels are drawn
+# as a pixel, and the ones with only smaller descendants aren't generated.
+# With inverse the poincare model is drawn per pixel, see render_inverse.
+# vectorized composites the Klein model edge images with NumPy. show is off
+# for running headless. With a cache the tiling is loaded from there or
+# stored, instead of being generated while drawing, unless only a sector
+# or polygons above min_size are generated. The messages go to log.
+def main(params: DiskParams, fishes: List['Image'], output: str, poincare: bool, workers: int = 1, flatness: Optional[float] = DEFAULT_FLATNESS, sprites: Optional[SpriteCache] = None, symmetric: bool = False, block: int = 0, min_size: float = 0, inverse: bool = False, vectorized: bool = False, show: bool = True, cache: Optional['TilingCache'] = None, log: Callable[..., None] = print):
+  im = draw(params, fishes, poincare, workers, flatness, sprites, symmetric, block, min_size, inverse, vectorized, log, cache)
+  if poincare or inverse:
+    log(f'poincare model will be saved as: "{output}"')
+  else:
+    log(f'Kleine model will be saved as: "{output}"')
+  save(im, output, show, log)
+
+# The image of main, returned instead of saved, a TiledCanvas with a block
+# size. The messages go to log.
+def draw(params: DiskParams, fishes: List['Image'], poincare: bool, workers: int = 1, flatness: Optional[float] = DEFAULT_FLATNESS, sprites: Optional[SpriteCache] = None, symmetric: bool = False, block: int = 0, min_size: float = 0, inverse: bool = False, vectorized: bool = False, log: Callable[..., None] = print, cache: Optional['TilingCache'] = None) -> Union['Image', 'TiledCanvas']:
+  with decimal_context():
+    if inverse:
+      from inverse import render_inverse
+      start_time = monotonic()
+      with telemetry.span('inverse'):
+        im = render_inverse(params)
+      log(f'elapsed: {round(monotonic() - start_time)}s')
+      return im
+    # only the poincare model is drawn by sectors and leaves out small
+    # polygons
+    symmetric = symmetric and poincare
+    min_size = min_size if poincare else 0
+    # polygons are generated while drawing, one layer at a time
+    polys = telemetry.timed('generate', iter_polys(params, sector=symmetric, min_size=min_size))
+    topology = None
+    if cache and not symmetric and not min_size:
+      with telemetry.span('tiling_cache'):
+        disk = cache.get(params)
+      log(cache)
+      polys = disk.iter_polys()
+      topology = disk.topology()
+    if block:
+      from tiles import TiledCanvas
+    _, amount = count_polys(params)
+    log('total polys:', amount)
+    if not poincare:
+      size = min(params.width, params.height)
+      return draw_kleine_fishes(polys, topology or make_topology(params), size, fishes, sprites, TiledCanvas(size, size, block) if block else None, vectorized, log)
+    canvas = TiledCanvas(params.width, params.height, block) if block else None
+    im = canvas or Image.new('RGBA', (params.width, params.height))
+    draw = canvas or ImageDraw.Draw(im)
+    if symmetric:
+      amount = 1 + (amount - 1) // params.n
+      log('polys in a sector:', amount)
+      outlines = iter_symmetric_outlines(polys, params.n, params.width, params.height, workers, flatness=flatness, min_size=min_size)
+    else:
+      outlines = iter_outlines(polys, params.width, params.height, workers, flatness=flatness, min_size=min_size)
+    # every outline of a sector polygon is drawn in each sector
+    outline_count = 1 + (amount - 1) * params.n if symmetric else amount
+    draw_outlines(draw, outlines, amount, outline_count, symmetric, min_size, log)
+    return im
+
+# Draw the poincare model outlines (index, color, outline) of amount
+# polygons, outline_count in all with symmetric, see draw.
+def draw_outlines(draw: Union[ImageDraw.ImageDraw, 'TiledCanvas'], outlines: Iterable[Tuple[int, Color, array]], amount: int, outline_count: int, symmetric: bool = False, min_size: float = 0, log: Callable[..., None] = print):
   total = 0
-  amount = len(disk.polys)
   report_seconds = 3
   insignificants = 0
   start_time = monotonic()
   current_time = start_time
-  print('total polys:', amount)
-  if not poincare:
-    show_kleine_fishes(disk, min(params.width, params.height), fishes, output)
-    return
-  for i, (poly, color) in enumerate(zip(disk.polys, disk.colors), 1):
-    pts = get_scl(poly, params.width, params.height).points()
-    current = len(pts)
-    total += current
-    if monotonic() > current_time + report_seconds:
-      current_time = monotonic()
-      print(f'[{i}/{amount}] points in poly: {current}, total: {total}, insignificants: {insignificants}')
-    if current < 2:
-      insignificants += 1
-      continue
-    draw.polygon(pts, fill=color)
-  print(f'total points: {total}, insignificants: {insignificants}, elapsed: {round(monotonic() - start_time)}s')
-  print(f'poincare model will be saved as: "{output}"')
-  if output.endswith('.jpg'):
-    im = im.convert('RGB')
-  im.show()
-  im.save(output)
+  drawn = 0
+  with telemetry.span('poincare', polys=amount):
+    for i, color, pts in outlines:
+      current = len(pts) // 2
+      total += current
+      drawn += 1
+      if drawn % PROGRESS_POLYS == 0:
+        telemetry.progress('outlines', drawn, outline_count)
+      if monotonic() > current_time + report_seconds:
+        current_time = monotonic()
+        log(f'[{i + 1}/{amount}] points in poly: {current}, total: {total}, insignificants: {insignificants}')
+      if current < 2:
+        insignificants += 1
+        if min_size:
+          draw.point(pts.tolist(), fill=color)
+        continue
+      with telemetry.timer('draw'):
+        draw.polygon(pts.tolist(), fill=color)
+        if symmetric:
+          # rotated outlines can be a pixel apart at shared edges, drawing
+          # the outline too covers the gaps
+          draw.line(pts.tolist(), fill=color)
+  telemetry.count('points', total)
+  telemetry.count('insignificants', insignificants)
+  telemetry.progress('outlines', drawn, outline_count)
+  log(f'total points: {total}, insignificants: {insignificants}, elapsed: {round(monotonic() - start_time)}s')
+
+def check_backend(params: DiskParams):
+  with decimal_context():
+    reference_params = DiskParams(params.n, params.k, params.layers, params.width, params.colors, 'decimal')
+    start_time = monotonic()
+    reference = PoincareDisk.new(reference_params)
+    reference_time = monotonic() - start_time
+    start_time = monotonic()
+    disk = PoincareDisk.new(params)
+    backend_time = monotonic() - start_time
+    deviation, pixels = max_deviation(reference.polys, disk.polys, params.width)
+    print(f'total polys: {len(disk.polys)}')
+    print(f'decimal: {reference_time:.3f}s, {params.backend}: {backend_time:.3f}s')
+    print(f'max vertex deviation: {deviation:.3e} ({pixels:.3e}px at size {params.width})')
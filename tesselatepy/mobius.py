@@ -0,0 +1,114 @@
+from cmath import exp, sqrt as csqrt
+from math import tanh
+from typing import Any, List
+from line import Line, CircleLine
+from point import Point
+from polygon import Polygon
+
+
+# Isometry of the Poincare disk as a 2x2 complex matrix:
+#
+#          a z + b
+#   z -> ---------     applied to the complex conjugate of z if conj,
+#          c z + d     which makes it orientation reversing (a reflection)
+#
+class Mobius:
+  __slots__ = ('a', 'b', 'c', 'd', 'conj')
+
+  def __init__(self, a: complex, b: complex, c: complex, d: complex, conj: bool):
+    # keep the determinant of unit size, so long products stay bounded
+    scale = csqrt(a * d - b * c)
+    self.a = a / scale
+    self.b = b / scale
+    self.c = c / scale
+    self.d = d / scale
+    self.conj = conj
+
+  @staticmethod
+  def identity() -> 'Mobius':
+    return Mobius(1, 0, 0, 1, False)
+
+  # the translation moving the center of the disk the hyperbolic distance
+  # in the direction, in radians
+  @staticmethod
+  def translation(distance: float, direction: float) -> 'Mobius':
+    a = tanh(distance / 2) * exp(1j * direction)
+    return Mobius(1, a, a.conjugate(), 1, False)
+
+  # reflection thru the line, same as line.reflect
+  @staticmethod
+  def reflection(line: Line) -> 'Mobius':
+    if isinstance(line, CircleLine):
+      # z -> c + r^2 / (z' - c'), the inversion in the circle
+      c = complex(line.c.x, line.c.y)
+      r = float(line.r)
+      return Mobius(c, r * r - abs(c) ** 2, 1, -c.conjugate(), True)
+    # z -> p + d^2 (z - p)', the mirror in the line thru p with direction d
+    p = complex(line.a.x, line.a.y)
+    d = complex(line.b.x, line.b.y) - p
+    d2 = d * d / abs(d) ** 2
+    return Mobius(d2, p - d2 * p.conjugate(), 0, 1, True)
+
+  # the isometry z -> self(other(z))
+  def compose(self, other: 'Mobius') -> 'Mobius':
+    a, b, c, d = other.a, other.b, other.c, other.d
+    if self.conj:
+      a, b, c, d = a.conjugate(), b.conjugate(), c.conjugate(), d.conjugate()
+    return Mobius(
+      self.a * a + self.b * c, self.a * b + self.b * d,
+      self.c * a + self.d * c, self.c * b + self.d * d,
+      self.conj != other.conj
+    )
+
+  def apply(self, z: complex) -> complex:
+    if self.conj:
+      z = z.conjugate()
+    return (self.a * z + self.b) / (self.c * z + self.d)
+
+  # apply to the flat float64 coordinates x0, y0, x1, y1, ... all at once,
+  # returned as a NumPy array of the same layout
+  def apply_coords(self, coords: Any) -> Any:
+    import numpy as np
+    z = np.frombuffer(coords, dtype=np.complex128)
+    if self.conj:
+      z = z.conjugate()
+    return ((self.a * z + self.b) / (self.c * z + self.d)).view(np.float64)
+
+# A polygon of the tiling as the image of the center polygon under an
+# isometry: vertex i is transform(center[labels[i]]).
+class MobiusTile:
+  __slots__ = ('transform', 'labels')
+
+  def __init__(self, transform: Mobius, labels: List[int]):
+    self.transform = transform
+    self.labels = labels
+
+class MobiusTiling:
+  def __init__(self, center: Polygon):
+    n = len(center)
+    self.center = [complex(pt.x, pt.y) for pt in center]
+    # reflections of the center polygon thru each of its sides
+    self.reflections = [Mobius.reflection(Line.new(center[i], center[(i + 1) % n])) for i in range(n)]
+
+  def center_tile(self) -> MobiusTile:
+    return MobiusTile(Mobius.identity(), list(range(len(self.center))))
+
+  # The reflection thru the side s of the tile g(P) is g R g^-1, where R is
+  # the reflection of P thru the matching side, so the new tile is g R (P).
+  # Vertices are relabeled the same way as in polygon.create_next_poly.
+  def next_tile(self, tile: MobiusTile, s: int) -> MobiusTile:
+    n = len(self.center)
+    first, second = tile.labels[s], tile.labels[(s + 1) % n]
+    side = first if second == (first + 1) % n else second
+    labels = [0] * n
+    for i in range(n):
+      labels[(n + s - i + 1) % n] = tile.labels[i]
+    return MobiusTile(tile.transform.compose(self.reflections[side]), labels)
+
+  # compute the vertices of the tile
+  def polygon(self, tile: MobiusTile) -> Polygon:
+    result = []
+    for label in tile.labels:
+      z = tile.transform.apply(self.center[label])
+      result.append(Point(z.real, z.imag))
+    return result
@@ -0,0 +1,113 @@
+import math
+from array import array
+from collections import deque
+from random import Random
+from typing import TYPE_CHECKING, Deque, Iterable, Iterator, List, Optional, Tuple
+from poincare_disk import Color
+from polygon import EdgeCache, Polygon, get_scl, screen_extent
+from circular_curve import DEFAULT_FLATNESS
+from decimal_math import decimal_context
+from scl import Scl
+import telemetry
+if TYPE_CHECKING:
+  from concurrent.futures import Future
+
+
+# Screen outline of a polygon as flat coordinates x0, y0, x1, y1, ...
+# in the buffer scl. Without flatness the random subdivision points of
+# the arcs come from a generator seeded by the polygon index, so an outline
+# doesn't depend on the process or thread that computes it, and the random
+# module is left alone. A polygon smaller than min_size pixels
+# isn't flattened, its outline is the single pixel of its first vertex.
+# Sides flattened before for a neighbor are taken from edges if given.
+def outline(index: int, poly: Polygon, width: int, height: int, flatness: Optional[float] = DEFAULT_FLATNESS, scl: Optional[Scl] = None, min_size: float = 0, edges: Optional[EdgeCache] = None) -> array:
+  if min_size and screen_extent(poly, width, height) < min_size:
+    scl = scl if scl is not None else Scl()
+    scl.clear()
+    radius = min(width // 2, height // 2)
+    scl.append(round(float(poly[0].x) * radius + width // 2), round(float(poly[0].y) * radius + height // 2))
+    return scl.coords
+  rng = Random(index) if flatness is None else None
+  return get_scl(poly, width, height, flatness, scl, edges, rng).coords
+
+def outline_chunk(chunk: List[Tuple[int, Polygon]], width: int, height: int, flatness: Optional[float], min_size: float) -> List[array]:
+  scl = Scl()
+  edges = EdgeCache()
+  with decimal_context():
+    return [array('i', outline(index, poly, width, height, flatness, scl, min_size, edges)) for index, poly in chunk]
+
+# Yield (index, color, outline) for the polygons (index, polygon, color,
+# rule) in order. With more than one worker the outlines are computed in
+# chunks by a process pool, keeping at most two chunks per worker in flight.
+# Otherwise the outline buffer is reused, so it's only valid until the next
+# outline. A side shared by two polygons is flattened once, with workers
+# only if both are in the same chunk. The time spent flattening, or waiting
+# for the workers, goes to the flatten timer.
+def iter_outlines(polys: Iterable[Tuple[int, Polygon, Color, int]], width: int, height: int, workers: int = 1, chunk: int = 64, flatness: Optional[float] = DEFAULT_FLATNESS, min_size: float = 0) -> Iterator[Tuple[int, Color, array]]:
+  if workers <= 1:
+    scl = Scl()
+    edges = EdgeCache()
+    for index, poly, color, _ in polys:
+      with telemetry.timer('flatten'):
+        pts = outline(index, poly, width, height, flatness, scl, min_size, edges)
+      yield index, color, pts
+    return
+  # multiprocessing takes a while to import, only worker runs need it
+  from concurrent.futures import ProcessPoolExecutor
+  with ProcessPoolExecutor(workers) as executor:
+    pending: Deque[Tuple[List[Tuple[int, Color]], 'Future']] = deque()
+
+    def submit(batch: List[Tuple[int, Polygon, Color]]):
+      # polygon views can't be pickled, send the points
+      work = [(index, list(poly)) for index, poly, _ in batch]
+      pending.append(([(index, color) for index, _, color in batch], executor.submit(outline_chunk, work, width, height, flatness, min_size)))
+
+    def done() -> Iterator[Tuple[int, Color, array]]:
+      keys, future = pending.popleft()
+      with telemetry.timer('flatten'):
+        results = future.result()
+      for (index, color), result in zip(keys, results):
+        yield index, color, result
+
+    batch: List[Tuple[int, Polygon, Color]] = []
+    for index, poly, color, _ in polys:
+      batch.append((index, poly, color))
+      if len(batch) == chunk:
+        submit(batch)
+        batch = []
+        if len(pending) >= 2 * workers:
+          yield from done()
+    if batch:
+      submit(batch)
+    while pending:
+      yield from done()
+
+# Outlines of a symmetric tiling from the polygons of one sector, see
+# iter_polys. The sector is flattened at SUBPIXELS times the screen size
+# and every outline but the center one is rotated into each of the n
+# sectors before rounding to pixels, so the curves are only flattened
+# once. Outlines are yielded in a reused buffer.
+SUBPIXELS = 16
+
+def iter_symmetric_outlines(polys: Iterable[Tuple[int, Polygon, Color, int]], n: int, width: int, height: int, workers: int = 1, chunk: int = 64, flatness: Optional[float] = DEFAULT_FLATNESS, min_size: float = 0) -> Iterator[Tuple[int, Color, array]]:
+  x_center = width // 2
+  y_center = height // 2
+  # keep the disk center and radius exact multiples of the screen ones
+  scaled_flatness = flatness * SUBPIXELS if flatness is not None else None
+  outlines = iter_outlines(polys, 2 * SUBPIXELS * x_center, 2 * SUBPIXELS * y_center, workers, chunk, scaled_flatness, min_size * SUBPIXELS)
+  rotations = [(math.cos(2 * math.pi * m / n), math.sin(2 * math.pi * m / n)) for m in range(n)]
+  scl = Scl()
+  for index, color, pts in outlines:
+    for cos_m, sin_m in rotations[:n if index else 1]:
+      yield index, color, rotate_outline(pts, x_center, y_center, cos_m, sin_m, scl)
+
+# rotate subpixel screen coordinates about the center into scl pixels
+def rotate_outline(pts: array, x_center: int, y_center: int, cos_a: float, sin_a: float, scl: Scl) -> array:
+  scl.clear()
+  x0 = x_center * SUBPIXELS
+  y0 = y_center * SUBPIXELS
+  for i in range(0, len(pts), 2):
+    x = pts[i] - x0
+    y = pts[i + 1] - y0
+    scl.append(round(x_center + (x * cos_a - y * sin_a) / SUBPIXELS), round(y_center + (x * sin_a + y * cos_a) / SUBPIXELS))
+  return scl.coords
@@ -0,0 +1,126 @@
+import math
+from argparse import ArgumentParser
+from json import dumps
+from typing import Any, Dict, List, Optional
+from poincare_disk import DiskParams, count_layers
+from backend import BACKENDS
+from circular_curve import DEFAULT_FLATNESS
+
+
+# Rough costs measured on the {5,4} tiling with CPython 3.11, see README.
+# Generation time and memory per polygon vertex for each backend.
+SECONDS_PER_POLY = {'decimal': 3e-5, 'float': 1.5e-5, 'numpy': 8e-6, 'mobius': 1.2e-5}
+BYTES_PER_VERTEX = {'decimal': 290, 'float': 30, 'numpy': 70, 'mobius': 100}
+# Flattening time per screen point of the Poincare outlines, and of the
+# random subdivision without a flatness, which runs on the coordinates.
+SECONDS_PER_POINT = {'decimal': 1.6e-5, 'float': 6e-6, 'numpy': 6e-6, 'mobius': 6e-6}
+SECONDS_PER_SUBDIVISION_POINT = {'decimal': 1.1e-3, 'float': 6e-5, 'numpy': 6e-5, 'mobius': 6e-5}
+# RGBA canvas
+BYTES_PER_PIXEL = 4
+
+class LayerPlan:
+  def __init__(self, layer: int, polys: int, tile_size: float, vertices: int, points: int):
+    self.layer = layer
+    self.polys = polys
+    # estimated screen size in pixels of the smallest tiles of the layer
+    self.tile_size = tile_size
+    self.vertices = vertices
+    # estimated screen points of the Poincare outlines
+    self.points = points
+
+class Plan:
+  def __init__(self, params: DiskParams, layers: List[LayerPlan], recommended_layers: int, flatness: Optional[float] = DEFAULT_FLATNESS):
+    self.params = params
+    # None for the random subdivision
+    self.flatness = flatness
+    self.layers = layers
+    self.polys = sum(layer.polys for layer in layers)
+    self.vertices = sum(layer.vertices for layer in layers)
+    self.points = sum(layer.points for layer in layers)
+    # the largest layer count whose tiles are at least a pixel
+    self.recommended_layers = recommended_layers
+    self.memory = self.vertices * BYTES_PER_VERTEX[params.backend] + params.width * params.height * BYTES_PER_PIXEL
+    self.generation_seconds = self.polys * SECONDS_PER_POLY[params.backend]
+    seconds_per_point = SECONDS_PER_POINT if flatness is not None else SECONDS_PER_SUBDIVISION_POINT
+    self.poincare_seconds = self.generation_seconds + self.points * seconds_per_point[params.backend]
+
+  def to_dict(self) -> Dict[str, Any]:
+    return {
+      'p': self.params.n,
+      'q': self.params.k,
+      'layers': self.params.layers,
+      'size': self.params.width,
+      'backend': self.params.backend,
+      'flatness': self.flatness or 0,
+      'polys': self.polys,
+      'vertices': self.vertices,
+      'points': self.points,
+      'memory': self.memory,
+      'generation_seconds': self.generation_seconds,
+      'poincare_seconds': self.poincare_seconds,
+      'recommended_layers': self.recommended_layers,
+      'per_layer': [vars(layer) for layer in self.layers],
+    }
+
+  def __str__(self) -> str:
+    lines = ['layer      polys  tile size(px)      vertices        points']
+    for layer in self.layers:
+      lines.append(f'{layer.layer:5} {layer.polys:10} {layer.tile_size:14.2f} {layer.vertices:13} {layer.points:13}')
+    lines.append(f'total polys: {self.polys}, vertices: {self.vertices}, points: {self.points}')
+    lines.append(f'estimated peak memory: {self.memory / 2 ** 20:.1f}MiB')
+    lines.append(f'estimated time: generation {self.generation_seconds:.1f}s, poincare model {self.poincare_seconds:.1f}s')
+    lines.append(f'recommended layers for size {self.params.width}: {self.recommended_layers}')
+    return '\n'.join(lines)
+
+# Estimated screen size of the smallest tiles of a layer. A tile spans the
+# hyperbolic distances d-R..d+R from the disk center, R being the
+# circumradius, and every layer moves the tiles at most 2R further, so the
+# Euclidean radial extent is at least tanh((d+R)/2) - tanh((d-R)/2).
+def tile_size(params: DiskParams, layer: int) -> float:
+  p, q = params.n, params.k
+  circumradius = math.acosh(1 / (math.tan(math.pi / p) * math.tan(math.pi / q)))
+  d = 2 * circumradius * layer
+  extent = math.tanh((d + circumradius) / 2) - math.tanh((d - circumradius) / 2)
+  return extent * min(params.width, params.height) / 2
+
+# The plan of params, flattened within flatness pixels or, if it's None,
+# subdivided at random points as with --flatness 0.
+def make_plan(params: DiskParams, flatness: Optional[float] = DEFAULT_FLATNESS) -> Plan:
+  layers = []
+  for layer, polys in enumerate(count_layers(params)):
+    size = tile_size(params, layer)
+    if flatness is None:
+      # The subdivision bends a side until it's within a hundredth of a
+      # pixel, a point every few pixels, fitted to the {5,4}, {7,3} and
+      # {4,6} tilings at sizes 400 and 1600.
+      points = polys * params.n * max(1, round(3 * size ** 0.7))
+    else:
+      # The segments of an arc grow with the square root of its radius
+      # over the flatness, fitted to the {5,4} tiling at sizes 400 and 1600.
+      points = polys * round(params.n + math.sqrt(size / flatness))
+    layers.append(LayerPlan(layer, polys, size, polys * params.n, points))
+  recommended = 0
+  while tile_size(params, recommended + 1) >= 1:
+    recommended += 1
+  return Plan(params, layers, recommended, flatness)
+
+def plan_cli(argv: List[str]) -> Optional[Plan]:
+  parser = ArgumentParser(prog='cli.py plan', description='estimate the cost of a tiling without generating it')
+  parser.add_argument('--layers', type=int, help='algorithm recursion depth, default: 4', default=4)
+  parser.add_argument('--size', type=int, help='output image width and height, default: 800px', default=800)
+  parser.add_argument('--vertices', '-p', type=int, help='number of vertices of each polygon, (p-2)(q-2) must be > 4', required=True)
+  parser.add_argument('--adjacency', '-q', type=int, help='number of polygons adjacent to each vertex, (p-2)(q-2) must be > 4', required=True)
+  parser.add_argument('--backend', choices=BACKENDS, help='numeric backend for the tiling generation, default: decimal', default='decimal')
+  parser.add_argument('--flatness', type=float, help='max distance in pixels between the poincare model arcs and their outlines, 0 for the old random subdivision, default: 0.25', default=DEFAULT_FLATNESS)
+  parser.add_argument('--json', help='print the plan as JSON', action='store_true')
+  parsed = parser.parse_args(argv)
+  if (parsed.vertices - 2) * (parsed.adjacency - 2) <= 4:
+    print('(p-2)(q-2) must be > 4')
+    return None
+  if parsed.flatness < 0:
+    print('flatness must not be negative')
+    return None
+  params = DiskParams(parsed.vertices, parsed.adjacency, parsed.layers, parsed.size, [], parsed.backend)
+  result = make_plan(params, parsed.flatness or None)
+  print(dumps(result.to_dict()) if parsed.json else result)
+  return result
@@ -1,14 +1,19 @@
 from random import choice
-from typing import List, Tuple
-from polygon import Polygon, construct_center_polygon, poly
-from line import CircleLine, Line
-from point import Point
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+from polygon import Polygon, poly, screen_extent
+from backend import get_backend
+from decimal_math import decimal_context
+from topology import Topology
 
 
 Color = str
+# polygon data indexed by the polygon index, a dict when only some
+# layers are kept, see iter_polys
+IntTable = Union[List[int], Dict[int, int]]
+ColorTable = Union[List[Color], Dict[int, Color]]
 
 class DiskParams:
-  def __init__(self, n: int, k: int, layers: int, size: int, colors: List[Color]):
+  def __init__(self, n: int, k: int, layers: int, size: int, colors: List[Color], backend: str = 'decimal'):
     self.n = n
     self.k = k
     # algorithm depth
@@ -19,6 +24,8 @@ class DiskParams:
     self.height = size
     self.colors = colors or flatcolors
     self._color_index = choice(range(len(self.colors)))
+    # numeric backend name, see backend.py
+    self.backend = backend
 
   def random_color(self) -> Color:
     result = self.colors[self._color_index]
@@ -26,24 +33,51 @@ class DiskParams:
     return result
 
 class PoincareDisk:
-  def __init__(self, n: int, polys: List[Polygon], rule: List[int], total: int, inner: int, colors: List[Color]):
+  def __init__(self, n: int, k: int, polys: Sequence[Polygon], rule: List[int], total: int, inner: int, colors: List[Color], parents: List[int], sides: List[int]):
     self.n = n
+    self.k = k
     self.polys = polys
     self.rule = rule
     self.total = total
     self.inner = inner
     self.colors = colors
+    # polygon j is the reflection of polygon parents[j] thru its side sides[j]
+    self.parents = parents
+    self.sides = sides
+    self._topology: Optional[Topology] = None
 
   def draw(self):
     pass
 
+  # (index, polygon, color, rule) of every polygon
+  def iter_polys(self) -> Iterator[Tuple[int, Polygon, Color, int]]:
+    for i, poly in enumerate(self.polys):
+      yield i, poly, self.colors[i], self.rule[i]
+
+  # adjacency of the polygons, built on first use
+  def topology(self) -> Topology:
+    if self._topology is None:
+      self._topology = Topology(self.n, self.k, self.parents, self.sides)
+    return self._topology
+
+  # (polygon, side, neighbor polygon or -1) once for every edge, the edge
+  # goes from polys[polygon][side] to the next vertex
+  def edges(self) -> Iterator[Tuple[int, int, int]]:
+    return self.topology().edges()
+
   @staticmethod
   def new(params: DiskParams) -> 'PoincareDisk':
     inner, total = count_polys(params)
     return determine_polys(inner, total, params)
 
 def count_polys(params: DiskParams) -> Tuple[int, int]:
-  inner, total = 0, 1
+  layers = count_layers(params)
+  total = sum(layers)
+  return total - layers[-1], total
+
+# number of polygons in each layer, the center polygon is the layer 0
+def count_layers(params: DiskParams) -> List[int]:
+  result = [1]
   n = params.n
   k = params.k
   a = n * (k - 3)
@@ -51,36 +85,124 @@ def count_polys(params: DiskParams) -> Tuple[int, int]:
   next_a, next_b = 0, 0
   if k == 3:
     for layer in range(1, params.layers + 1):
-      inner = total
       next_a = a + b
       next_b = (n - 6) * a + (n - 5) * b
-      total += a + b
+      result.append(a + b)
       a = next_a
       b = next_b
   else:
     for layer in range(1, params.layers + 1):
-      inner = total
       next_a = ((n - 2) * (k - 3) - 1) * a + ((n - 3) * (k - 3) - 1) * b
       next_b = (n - 2) * a + (n - 3) * b
-      total += a + b
+      result.append(a + b)
       a = next_a
       b = next_b
-  return inner, total
+  return result
 
 def determine_polys(inner: int, total: int, params: DiskParams) -> PoincareDisk:
-  polys = [poly(0) for _ in range(total)]
+  backend = get_backend(params.backend)
   rule = [0] * total
   colors = [""] * total
-  polys[0] = construct_center_polygon(params.n, params.k, False)
+  # polygon j is the reflection of polygon parents[j] thru its side sides[j]
+  parents = [0] * total
+  sides = [0] * total
   colors[0] = params.random_color()
   # index of the next polygon to create
   j = 1
   for i in range(inner):
-    j = apply_rule(i, j, rule, params, polys, colors)
-  return PoincareDisk(params.n, polys, rule, total, inner, colors)
+    j = apply_rule(i, j, rule, params, parents, sides, colors)
+  with decimal_context():
+    center = backend.center_polygon(params.n, params.k)
+    polys = backend.generate(center, parents, sides, params.n)
+  return PoincareDisk(params.n, params.k, polys, rule, total, inner, colors, parents, sides)
 
-def apply_rule(i: int, j: int, rule: List[int], params: DiskParams, polys: List[Polygon], colors: List[Color]) -> int:
-  is_alternating = params.k % 2 == 0
+# Adjacency of the polygons of the tiling without generating it, the same
+# as PoincareDisk.topology. The rule is only applied, so the colors of
+# params aren't used up.
+def make_topology(params: DiskParams) -> Topology:
+  inner, total = count_polys(params)
+  rule = [0] * total
+  parents = [0] * total
+  sides = [0] * total
+  j = 1
+  for i in range(inner):
+    j = apply_rule(i, j, rule, params, parents, sides, None)
+  return Topology(params.n, params.k, parents, sides)
+
+# Generate (index, polygon, color, rule) layer by layer, in the same order
+# and with the same colors as PoincareDisk.new. Only the previous and the
+# current layer are kept in memory, and the last layer, which is most of
+# the tiling, is dropped chunk by chunk as soon as it's yielded.
+#
+# Every layer but the center is n equal blocks, one for each side of the
+# center polygon, and each block is the rotation of the first one about
+# the center by a multiple of 2 pi / n. With sector only the center polygon
+# and the first block of every layer are generated, numbered from 0; with
+# an odd k their colors differ from PoincareDisk.new.
+#
+# With min_size the rule isn't applied to polygons whose descendants are
+# all smaller than min_size pixels, see subtree_growth, and the polygons
+# are numbered without the ones left out.
+def iter_polys(params: DiskParams, chunk: int = 1024, sector: bool = False, min_size: float = 0) -> Iterator[Tuple[int, Polygon, Color, int]]:
+  with decimal_context():
+    yield from _iter_polys(params, chunk, sector, min_size)
+
+def _iter_polys(params: DiskParams, chunk: int, sector: bool, min_size: float) -> Iterator[Tuple[int, Polygon, Color, int]]:
+  backend = get_backend(params.backend)
+  # polygons below this size have no visible descendants
+  min_parent = min_size / subtree_growth(params.k)
+  rule: Dict[int, int] = {0: 0}
+  colors: Dict[int, Color] = {0: params.random_color()}
+  parents: Dict[int, int] = {}
+  sides: Dict[int, int] = {}
+  polys: Dict[int, Any] = {0: backend.center_polygon(params.n, params.k)}
+
+  def forget(indices: range):
+    for i in indices:
+      del polys[i], rule[i]
+      parents.pop(i, None)
+      sides.pop(i, None)
+      # apply_rule alternates the first two colors
+      if i > 1:
+        del colors[i]
+
+  yield 0, backend.to_polygon(polys[0]), colors[0], rule[0]
+  # the previous layer
+  start, end = 0, 1
+  for layer in range(1, params.layers + 1):
+    j = end
+    # polygons created around a chunk of the previous layer
+    for chunk_start in range(start, end, chunk):
+      first = j
+      for i in range(chunk_start, min(chunk_start + chunk, end)):
+        if min_size and screen_extent(backend.to_polygon(polys[i]), params.width, params.height) < min_parent:
+          continue
+        j = apply_rule(i, j, rule, params, parents, sides, colors)
+      if sector and layer == 1:
+        # the rule of the center polygon creates all the blocks
+        block_end = first + (j - first) // params.n
+        for i in range(block_end, j):
+          del rule[i], parents[i], sides[i]
+          if i > 1:
+            del colors[i]
+        j = block_end
+      backend.extend(polys, parents, sides, range(first, j), params.n)
+      for i in range(first, j):
+        yield i, backend.to_polygon(polys[i]), colors[i], rule[i]
+      if layer == params.layers:
+        forget(range(first, j))
+    forget(range(start, end))
+    start, end = end, j
+
+# Bound on the screen size of the descendants of a polygon relative to the
+# polygon. The polygons created around a vertex by the rule are descendants
+# of the first one, so the bound grows with k. Measured up to 1.0 for
+# {5,4}, 1.2 for {4,5}, 2.1 for {4,8} and 2.8 for {3,12}.
+def subtree_growth(k: int) -> float:
+  return 1 + k / 3
+
+# the colors are left out if colors is None
+def apply_rule(i: int, j: int, rule: IntTable, params: DiskParams, parents: IntTable, sides: IntTable, colors: Optional[ColorTable]) -> int:
   r = rule[i]
   special = r == 1
   if special: r = 2
@@ -88,36 +210,40 @@ def apply_rule(i: int, j: int, rule: List[int], params: DiskParams, polys: List[
   quantity = params.n - r - 1 if params.k == 3 and r else params.n - r
   for s in range(start, start + quantity):
     # create a polygon adjacent to P[i]
-    polys[j] = create_next_poly(polys[i], s % params.n, params.n)
+    parents[j] = i
+    sides[j] = s % params.n
     rule[j] = 4 if params.k == 3 and s == start and r else 3
-    if is_alternating and j > 1:
-      colors[j] = colors[1] if colors[i] == colors[0] else colors[0]
-    else:
-      colors[j] = params.random_color()
+    if colors is not None:
+      colors[j] = next_color(j, i, params, colors)
     j += 1
     m = 0
     if special: m = 2
     elif s==2 and r: m = 1
     for m in range(m, params.k - 3):
       # Create a polygon adjacent to P[j-1]
-      polys[j] = create_next_poly(polys[j - 1], 1, params.n)
+      parents[j] = j - 1
+      sides[j] = 1
       rule[j] = 1 if params.n == 3 and m == params.k - 4 else 2
-      if is_alternating:
-        colors[j] = colors[1] if colors[j - 1] == colors[0] else colors[0]
-      else:
-        colors[j] = params.random_color()
+      if colors is not None:
+        colors[j] = next_color(j, j - 1, params, colors)
       j += 1
   return j
 
-# reflect P thru the point or the side indicated by the side s
-# to produce the resulting polygon Q
-def create_next_poly(p: Polygon, s: int, n: int) -> Polygon:
-  q = poly(n)
-  c = Line.new(p[s], p[(s + 1) % n])
-  for i in range(n):
-    j = (n + s - i + 1) % n
-    q[j] = c.reflect(p[i])
-  return q
+# Color of the polygon j created from the polygon parent. With an even k
+# the first two colors alternate, otherwise every polygon gets the next
+# color of params.
+def next_color(j: int, parent: int, params: DiskParams, colors: ColorTable) -> Color:
+  if params.k % 2 == 0 and j > 1:
+    return colors[1] if colors[parent] == colors[0] else colors[0]
+  return params.random_color()
+
+# The colors of the polygons of a tiling from their parents, the same as
+# apply_rule gives them, as the polygons are created in index order.
+def assign_colors(params: DiskParams, parents: Sequence[int]) -> List[Color]:
+  colors = [params.random_color()]
+  for j in range(1, len(parents)):
+    colors.append(next_color(j, parents[j], params, colors))
+  return colors
 
 # https://flatuicolors.com/palette/defo
 flatcolors = [
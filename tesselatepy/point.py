@@ -121,7 +121,7 @@ class Point:
   #           t -  A B'                conjugate of B
   #
   def reflect(self, w: 'Point') -> 'Point':
-    t = (Decimal(1) + self.norm_squared()) / Decimal(2)
+    t = (1 + self.norm_squared()) / 2
     numerator = self.minusc(w.times(t))
     denominator = Point.subc(t, w.timesc(self.conjugate()))
     return numerator.overc(denominator)
@@ -1,46 +1,128 @@
+from array import array
+from random import Random
 from point import Point
-from typing import List, Optional, cast
+from typing import Callable, Dict, List, Optional, Tuple
 from scl import Scl
-from decimal_math import Decimal, sin, pi, cos, sqrt
+from decimal_math import Decimal, Number, sin, pi, cos, sqrt
 from line import Line, CircleLine
+from circular_curve import DEFAULT_FLATNESS
+import telemetry
 
 
 Polygon = List[Point]
 
-def construct_center_polygon(n: int, k: int, quasiregular: bool) -> Polygon:
+def construct_center_polygon(n: int, k: int, quasiregular: bool, numeric: Callable[..., Number] = Decimal) -> Polygon:
   # Initialize P as the center polygon in an n-k regular or quasiregular tiling.
   # Let ABC be a triangle in a regular (n,k0-tiling, where
   #    A is the center of an n-gon (also center of the disk),
   #    B is a vertex of the n-gon, and
   #    C is the midpoint of a side of the n-gon adjacent to B.
-  angle_a = pi / n
-  angle_b = pi / k
-  angle_c = pi / 2
+  # Coordinates are of the numeric type, i.e. Decimal or float.
+  angle_a = numeric(pi) / n
+  angle_b = numeric(pi) / k
+  angle_c = numeric(pi) / 2
   # For a regular tiling, we need to compute the distance s from A to B.
   sin_a = sin(angle_a)
   sin_b = sin(angle_b)
-  s = sin(angle_c - angle_b - angle_a) / sqrt(Decimal(1) - sin_b * sin_b - sin_a * sin_a)
+  s = sin(angle_c - angle_b - angle_a) / sqrt(1 - sin_b * sin_b - sin_a * sin_a)
   # But for a quasiregular tiling, we need the distance s from A to C.
   if quasiregular:
-    s = (s * s + Decimal(1)) / (Decimal(2) * s * cos(angle_a))
-    s = s - sqrt(s * s - Decimal(1))
+    s = (s * s + 1) / (2 * s * cos(angle_a))
+    s = s - sqrt(s * s - 1)
   # Now determine the coordinates of the n vertices of the n-gon.
   # They're all at distance s from the center of the Poincare disk.
   poly = [Point(s, s) for _ in range(n)]
   for i, pt in enumerate(poly):
-    pt.x *= cos(Decimal(3 + 2 * i) * angle_a)
-    pt.y *= sin(Decimal(3 + 2 * i) * angle_a)
+    pt.x *= cos((3 + 2 * i) * angle_a)
+    pt.y *= sin((3 + 2 * i) * angle_a)
   return poly
 
 def get_lines(poly: Polygon) -> List[CircleLine]:
   n = len(poly)
   return [Line.new(pt, poly[(i + 1) % n]) for i, pt in enumerate(poly)]
 
-def get_scl(poly: Polygon, width: int, height: int) -> Scl:
-  scl: Optional[Scl] = None
+# width or height in pixels of the screen bounding box of the vertices,
+# whichever is larger
+def screen_extent(poly: Polygon, width: int, height: int) -> float:
+  xs = [float(pt.x) for pt in poly]
+  ys = [float(pt.y) for pt in poly]
+  return max(max(xs) - min(xs), max(ys) - min(ys)) * min(width // 2, height // 2)
+
+# The outline of the polygon, in scl if given, which is cleared first.
+# With edges the sides already flattened for a neighbor are taken from it,
+# see EdgeCache; the random subdivision without a flatness isn't shared,
+# its points come from rng if given.
+def get_scl(poly: Polygon, width: int, height: int, flatness: Optional[float] = DEFAULT_FLATNESS, scl: Optional[Scl] = None, edges: Optional['EdgeCache'] = None, rng: Optional[Random] = None) -> Scl:
+  if scl is None:
+    scl = Scl()
+  scl.clear()
+  if edges is not None and flatness is not None:
+    return edges.append_scl(scl, poly, width, height, flatness)
   for line in get_lines(poly):
-    scl = line.append_scl(scl, width, height)
-  return cast(Scl, scl)
+    line.append_scl(scl, width, height, flatness, rng)
+  return scl
+
+Edge = Tuple[int, int, int, int]
+
+# Flattened sides shared by the outlines of neighboring polygons. An
+# interior side belongs to two polygons that run along it in opposite
+# directions, so the second one gets the screen points of the first one
+# reversed instead of building the line and flattening the arc again.
+# Sides are keyed by the screen pixels of their vertices, which both
+# polygons round alike although they compute the vertices by different
+# reflections, and dropped once taken, so only the sides on the border of
+# the polygons drawn so far are kept. Only the points between the vertices
+# are kept, the outline has the pixels of the vertices itself.
+class EdgeCache:
+  def __init__(self):
+    self.arcs: Dict[Edge, array] = {}
+    self.hits = 0
+    self.misses = 0
+
+  # append the outline of the polygon to scl like get_scl does
+  def append_scl(self, scl: Scl, poly: Polygon, width: int, height: int, flatness: float) -> Scl:
+    x_center = width // 2
+    y_center = height // 2
+    radius = min(x_center, y_center)
+    points = list(poly)
+    # the same rounding as Line.append_scl
+    xs = [round(pt.x * radius + x_center) for pt in points]
+    ys = [round(pt.y * radius + y_center) for pt in points]
+    arcs = self.arcs
+    coords = scl.coords
+    scl.append(xs[0], ys[0])
+    n = len(points)
+    hits = 0
+    for i in range(n):
+      j = i + 1 if i + 1 < n else 0
+      arc = arcs.pop((xs[j], ys[j], xs[i], ys[i]), None)
+      if arc is None:
+        start = len(coords)
+        Line.new(points[i], points[j]).append_scl(scl, width, height, flatness)
+        # the vertex i was the last point already, the vertex j is last now
+        arcs[xs[i], ys[i], xs[j], ys[j]] = coords[start:-2]
+        continue
+      hits += 1
+      reversed_arc = array('i', arc)
+      reversed_arc[0::2] = arc[-2::-2]
+      reversed_arc[1::2] = arc[-1::-2]
+      coords.extend(reversed_arc)
+      scl.append(xs[j], ys[j])
+    self.hits += hits
+    self.misses += n - hits
+    telemetry.count('edge_hits', hits)
+    telemetry.count('edge_misses', n - hits)
+    return scl
+
+# reflect P thru the point or the side indicated by the side s
+# to produce the resulting polygon Q
+def create_next_poly(p: Polygon, s: int, n: int) -> Polygon:
+  q = poly(n)
+  c = Line.new(p[s], p[(s + 1) % n])
+  for i in range(n):
+    j = (n + s - i + 1) % n
+    q[j] = c.reflect(p[i])
+  return q
 
 def poly(n: int) -> Polygon:
   zero = Decimal(0)
@@ -0,0 +1,74 @@
+from array import array
+from typing import Any, Iterator, List, Tuple
+from point import Point
+from polygon import Polygon
+
+
+# Vertices of all polygons in a single flat buffer of doubles
+# x0, y0, x1, y1, ... where the polygon i spans the vertices
+# offsets[i] until offsets[i + 1].
+# The buffer can't grow while views of it are alive, so polygons are
+# appended first and viewed afterwards.
+class PolygonStore:
+  def __init__(self, coords: Any = None, offsets: Any = None):
+    self.coords = coords if coords is not None else array('d')
+    self.offsets = offsets if offsets is not None else array('q', [0])
+
+  # polygons of n vertices each from an array of the shape (polys, n, 2)
+  @staticmethod
+  def from_array(coords: Any) -> 'PolygonStore':
+    total, n, _ = coords.shape
+    return PolygonStore(array('d', coords.tobytes()), array('q', range(0, (total + 1) * n, n)))
+
+  def append(self, poly: Polygon):
+    for pt in poly:
+      self.coords.append(pt.x)
+      self.coords.append(pt.y)
+    self.offsets.append(len(self.coords) // 2)
+
+  def __len__(self) -> int:
+    return len(self.offsets) - 1
+
+  def __getitem__(self, i: int) -> 'PolygonView':
+    if i < 0:
+      i += len(self)
+    if not 0 <= i < len(self):
+      raise IndexError('polygon index out of range')
+    return PolygonView(memoryview(self.coords)[2 * self.offsets[i]:2 * self.offsets[i + 1]])
+
+  def __iter__(self) -> Iterator['PolygonView']:
+    view = memoryview(self.coords)
+    offsets = self.offsets
+    for i in range(len(self)):
+      yield PolygonView(view[2 * offsets[i]:2 * offsets[i + 1]])
+
+# Zero-copy view of one polygon of the store. It can be used in place of a
+# list of points, the points are only created on access.
+class PolygonView:
+  __slots__ = ('coords',)
+
+  def __init__(self, coords: memoryview):
+    self.coords = coords
+
+  def __len__(self) -> int:
+    return len(self.coords) // 2
+
+  def __getitem__(self, i: int) -> Point:
+    if i < 0:
+      i += len(self)
+    return Point(self.coords[2 * i], self.coords[2 * i + 1])
+
+  def __iter__(self) -> Iterator[Point]:
+    coords = self.coords
+    for i in range(0, len(coords), 2):
+      yield Point(coords[i], coords[i + 1])
+
+  def xy(self) -> List[Tuple[float, float]]:
+    coords = self.coords
+    return list(zip(coords[0::2], coords[1::2]))
+
+# vertex coordinates of a list of points or a polygon view
+def coordinates(poly: Any) -> List[Tuple[Any, Any]]:
+  if isinstance(poly, PolygonView):
+    return poly.xy()
+  return [(pt.x, pt.y) for pt in poly]
@@ -0,0 +1,56 @@
+from io import BytesIO
+from typing import Any, List, Optional, Union
+from PIL import Image
+from poincare_disk import DiskParams
+from sprites import SpriteCache
+from tiling_cache import TilingCache
+from circular_curve import DEFAULT_FLATNESS
+from main import draw
+from formats import VECTOR_FORMATS
+from vector import save_vector
+
+
+MODES = ['poincare', 'klein', 'inverse']
+
+# Draw a tiling in memory, for using the drawing as a library: nothing is
+# printed, shown or written to disk. mode is one of MODES, see main for the
+# other arguments; the klein mode needs the edge images in fishes. A
+# SpriteCache shared between calls keeps its sprites and a TilingCache the
+# generated tilings. Returns the RGBA image, or with a format the image
+# encoded by encode(). The formats 'svg' and 'pdf' of the poincare mode
+# return the vector drawing of vector.save_vector instead.
+def render(params: DiskParams, mode: str = 'poincare', fishes: Optional[List['Image.Image']] = None, format: Optional[str] = None, workers: int = 1, flatness: Optional[float] = DEFAULT_FLATNESS, sprites: Optional[SpriteCache] = None, symmetric: bool = False, min_size: float = 0, vectorized: bool = False, cache: Optional[TilingCache] = None, **options: Any) -> Union['Image.Image', bytes]:
+  if mode not in MODES:
+    raise ValueError(f"mode must be one of {', '.join(MODES)}, not '{mode}'")
+  if mode == 'klein' and not fishes:
+    raise ValueError('the klein mode requires edge images')
+  if (symmetric or min_size) and mode != 'poincare':
+    raise ValueError('symmetric and min_size require the poincare mode')
+  if symmetric and params.k % 2:
+    raise ValueError('symmetric requires an even q')
+  if format is not None and '.' + format.lower() in VECTOR_FORMATS:
+    if mode != 'poincare':
+      raise ValueError(f'the {format} format requires the poincare mode')
+    buffer = BytesIO()
+    save_vector(params, buffer, '.' + format.lower(), min_size, cache, quiet)
+    return buffer.getvalue()
+  im = draw(params, fishes or [], mode != 'klein', workers, flatness, sprites, symmetric, 0, min_size, mode == 'inverse', vectorized, log=quiet, cache=cache)
+  if format is None:
+    return im
+  return encode(im, format, **options)
+
+# The image in a PIL format like 'PNG', 'JPEG' or 'WEBP', options are the
+# ones of Image.save for it, i.e. compress_level=1 for fast PNG or
+# quality=90. JPEG has no alpha, the transparent pixels become black.
+def encode(im: 'Image.Image', format: str, **options: Any) -> bytes:
+  format = format.upper()
+  if format == 'JPG':
+    format = 'JPEG'
+  if format == 'JPEG':
+    im = im.convert('RGB')
+  buffer = BytesIO()
+  im.save(buffer, format, **options)
+  return buffer.getvalue()
+
+def quiet(*args: Any):
+  pass
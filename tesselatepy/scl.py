@@ -1,20 +1,44 @@
-from typing import Optional, List, Tuple
+from array import array
+from typing import List, Tuple
 
+# Screen coordinate list: the outline of a polygon as flat integer
+# coordinates x0, y0, x1, y1, ... in one growing buffer. A point equal to
+# the last one isn't added again. The buffer is meant to be cleared and
+# reused for the next polygon instead of allocating a new one.
 class Scl:
-  __slots__ = ('link', 'x', 'y')
+  __slots__ = ('coords',)
 
-  def __init__(self, link: Optional['Scl'] = None, x: int = 0, y: int = 0):
-    self.link = link
-    self.x = x
-    self.y = y
+  def __init__(self):
+    self.coords = array('i')
+
+  def clear(self):
+    del self.coords[:]
+
+  def append(self, x: int, y: int):
+    coords = self.coords
+    if not coords or coords[-2] != x or coords[-1] != y:
+      coords.append(x)
+      coords.append(y)
+
+  # the last point
+  @property
+  def x(self) -> int:
+    return self.coords[-2]
+
+  @property
+  def y(self) -> int:
+    return self.coords[-1]
+
+  def __len__(self) -> int:
+    return len(self.coords) // 2
+
+  # flat coordinates as PIL's ImageDraw accepts them
+  def flat(self) -> List[int]:
+    return self.coords.tolist()
 
   def points(self) -> List[Tuple[int, int]]:
-    result: List[Tuple[int, int]] = []
-    last: Optional[Scl] = self
-    while last:
-      result.append((last.x, last.y))
-      last = last.link
-    return result
+    coords = self.coords
+    return list(zip(coords[0::2], coords[1::2]))
 
   def __repr__(self) -> str:
-    return f'Scl({len(self.points())} points)'
+    return f'Scl({len(self)} points)'
@@ -0,0 +1,186 @@
+import json
+import os
+import stat
+import sys
+import threading
+from argparse import ArgumentParser
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from socketserver import StreamRequestHandler, ThreadingUnixStreamServer
+from time import monotonic
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from PIL import Image
+from poincare_disk import DiskParams, PoincareDisk, assign_colors, count_polys, determine_polys
+from tiling_cache import TilingCache, DEFAULT_CACHE_BUDGET
+from cli import Args, load_image, run
+
+
+DEFAULT_TILINGS = 16
+
+# The last used tilings kept in memory, the same kind of cache for draw as
+# a TilingCache, which it falls back to if given. The polygons and their
+# topology are shared by the renders of a tiling, the colors are drawn for
+# each one. Renders of a tiling that isn't there yet may both generate it.
+class TilingMemory:
+  def __init__(self, size: int = DEFAULT_TILINGS, cache: Optional[TilingCache] = None):
+    self.size = size
+    self.cache = cache
+    self.tilings: 'OrderedDict[Tuple[int, int, int, str], PoincareDisk]' = OrderedDict()
+    self.lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, params: DiskParams) -> PoincareDisk:
+    key = (params.n, params.k, params.layers, params.backend)
+    with self.lock:
+      tiling = self.tilings.get(key)
+      if tiling is not None:
+        self.hits += 1
+        self.tilings.move_to_end(key)
+      else:
+        self.misses += 1
+    if tiling is None:
+      tiling = self.cache.get(params) if self.cache else determine_polys(*count_polys(params), params)
+      # built here, not by the concurrent renders sharing it
+      tiling.topology()
+      with self.lock:
+        self.tilings[key] = tiling
+        while len(self.tilings) > self.size:
+          self.tilings.popitem(last=False)
+    disk = PoincareDisk(tiling.n, tiling.k, tiling.polys, tiling.rule, tiling.total, tiling.inner, assign_colors(params, tiling.parents), tiling.parents, tiling.sides)
+    disk._topology = tiling.topology()
+    return disk
+
+  def __str__(self) -> str:
+    return f'tilings in memory: {self.hits} hits, {self.misses} misses'
+
+# Renders cli.py arguments in threads of one process, keeping the tilings
+# and the edge images of earlier renders. A request is a JSON object with
+# the arguments in argv and an id returned with the response:
+#   {"id": 1, "argv": ["-p", "5", "-q", "4", "--poincare", "-o", "a.png"]}
+# The response has ok, the output file, seconds taken and the messages of
+# the render in log, or the error if it failed.
+class Server:
+  def __init__(self, tilings: TilingMemory, threads: int = 1):
+    self.tilings = tilings
+    self.executor = ThreadPoolExecutor(threads)
+    # edge images and the modification time they were loaded at by path, an
+    # image is replaced when its file changes
+    self.images: Dict[str, Tuple[float, 'Image.Image']] = {}
+    self.lock = threading.Lock()
+
+  def load(self, path: str) -> 'Image.Image':
+    key, mtime = os.path.abspath(path), os.stat(path).st_mtime
+    with self.lock:
+      entry = self.images.get(key)
+    if entry is None or entry[0] != mtime:
+      entry = (mtime, load_image(path))
+      with self.lock:
+        self.images[key] = entry
+    return entry[1]
+
+  def render(self, request: Any) -> Dict[str, Any]:
+    start_time = monotonic()
+    messages: List[str] = []
+
+    def log(*args: Any):
+      messages.append(' '.join(map(str, args)))
+
+    def failed(error: str) -> Dict[str, Any]:
+      return {'id': id, 'ok': False, 'error': error, 'log': messages}
+
+    id = request.get('id') if isinstance(request, dict) else None
+    argv = request.get('argv') if isinstance(request, dict) else None
+    if not isinstance(argv, list) or not all(isinstance(arg, str) for arg in argv):
+      return failed('argv must be a list of strings')
+    args = Args.parse(argv, log, self.load, exit_on_error=False)
+    if not args:
+      return failed(messages.pop() if messages else 'invalid arguments')
+    if args.check_backend or args.trace:
+      return failed('--check-backend and --trace are not served')
+    if args.workers > 1:
+      return failed('the server draws in threads, --workers is not served')
+    args.cache = self.tilings
+    try:
+      run(args, log, show=False)
+    except Exception as e:
+      return failed(f'{type(e).__name__}: {e}')
+    return {'id': id, 'ok': True, 'output': args.output, 'seconds': round(monotonic() - start_time, 3), 'log': messages}
+
+  # Answer the requests of lines, one per line, with write as they are done,
+  # in any order. Returns when all of them are answered.
+  def serve(self, lines: Iterable[str], write: Callable[[str], None]):
+    lock = threading.Lock()
+
+    def answer(request: Any):
+      response = self.render(request)
+      with lock:
+        write(json.dumps(response) + '\n')
+
+    pending = []
+    for line in lines:
+      if not line.strip(): continue
+      try:
+        request = json.loads(line)
+      except ValueError as e:
+        with lock:
+          write(json.dumps({'id': None, 'ok': False, 'error': f'invalid request: {e}', 'log': []}) + '\n')
+        continue
+      pending.append(self.executor.submit(answer, request))
+    wait(pending)
+
+# serve requests on a Unix socket, one connection per client
+def serve_socket(server: Server, path: str):
+
+  class Handler(StreamRequestHandler):
+    def handle(self):
+      def write(line: str):
+        self.wfile.write(line.encode())
+        self.wfile.flush()
+      server.serve((line.decode() for line in self.rfile), write)
+
+  # a socket left by a server that didn't stop cleanly
+  if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+    os.remove(path)
+  with ThreadingUnixStreamServer(path, Handler) as unix:
+    unix.daemon_threads = True
+    print(f'serving on {path}', file=sys.stderr)
+    try:
+      unix.serve_forever()
+    except KeyboardInterrupt:
+      pass
+    finally:
+      os.remove(path)
+
+def serve_cli(argv: List[str]) -> bool:
+  parser = ArgumentParser(prog='cli.py serve', description='render cli.py arguments sent as JSON lines, one request per line, keeping tilings and edge images in memory between renders')
+  parser.add_argument('--socket', help='listen on this Unix socket instead of reading stdin and answering on stdout')
+  parser.add_argument('--threads', type=int, help=f'requests rendered at once, default: {os.cpu_count()}', default=os.cpu_count())
+  parser.add_argument('--tilings', type=int, help=f'tilings kept in memory, the least recently used are dropped beyond it, default: {DEFAULT_TILINGS}', default=DEFAULT_TILINGS)
+  parser.add_argument('--cache', help='folder keeping generated tilings, read when a tiling is not in memory')
+  parser.add_argument('--cache-size', type=float, help='disk space of the --cache folder in MiB, default: 512', default=DEFAULT_CACHE_BUDGET / 2 ** 20)
+  parsed = parser.parse_args(argv)
+  if parsed.threads < 1 or parsed.tilings < 1:
+    print('threads and tilings must be positive')
+    return False
+  cache = None
+  if parsed.cache:
+    try:
+      cache = TilingCache(parsed.cache, int(parsed.cache_size * 2 ** 20))
+    except OSError as e:
+      print(f"Can't use cache folder '{parsed.cache}': {e}")
+      return False
+  server = Server(TilingMemory(parsed.tilings, cache), parsed.threads)
+  if parsed.socket:
+    serve_socket(server, parsed.socket)
+    return True
+  responses = sys.stdout
+  # messages printed while drawing would mix with the responses
+  sys.stdout = sys.stderr
+
+  def write(line: str):
+    responses.write(line)
+    responses.flush()
+
+  server.serve(sys.stdin, write)
+  return True
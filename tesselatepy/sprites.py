@@ -0,0 +1,67 @@
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Tuple
+import telemetry
+if TYPE_CHECKING:
+  from PIL import Image
+
+
+SpriteKey = Tuple[int, int, int, float]
+
+# Default quantization of the Klein model edge sprites: their size is
+# rounded down to whole steps of pixels and their angle to steps of degrees.
+DEFAULT_STEP = 1
+DEFAULT_ANGLE_STEP = 0.5
+DEFAULT_BUDGET = 64 * 2 ** 20
+
+# Resized and rotated edge images by (image, length, thickness, angle),
+# the least recently used ones are dropped to stay within budget bytes.
+# An angle step of 0 keeps the exact angles. Images aren't hashable, they
+# are keyed by id and kept with their sprites, so the id of an image isn't
+# reused for another one while it has sprites in the cache.
+class SpriteCache:
+  def __init__(self, step: int = DEFAULT_STEP, angle_step: float = DEFAULT_ANGLE_STEP, budget: int = DEFAULT_BUDGET):
+    self.step = step
+    self.angle_step = angle_step
+    self.budget = budget
+    self.sprites: 'OrderedDict[SpriteKey, Tuple[Image.Image, Image.Image]]' = OrderedDict()
+    self.bytes = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  # the image resized to length x thickness pixels and rotated
+  # counterclockwise by angle degrees
+  def get(self, image: 'Image.Image', length: float, thickness: float, angle: float) -> 'Image.Image':
+    width = max(1, int(length) // self.step)
+    height = max(1, int(thickness) // self.step)
+    if self.angle_step:
+      angle = round(angle / self.angle_step) * self.angle_step
+    key = (id(image), width, height, angle)
+    entry = self.sprites.get(key)
+    if entry is not None:
+      self.hits += 1
+      telemetry.count('sprite_hits')
+      self.sprites.move_to_end(key)
+      return entry[1]
+    self.misses += 1
+    telemetry.count('sprite_misses')
+    from PIL import Image
+    with telemetry.timer('sprite_transform'):
+      sprite = image.resize((width * self.step, height * self.step), Image.LANCZOS).rotate(angle, expand=True)
+    self.sprites[key] = (image, sprite)
+    self.bytes += sprite_bytes(sprite)
+    while self.bytes > self.budget and len(self.sprites) > 1:
+      _, (_, old) = self.sprites.popitem(last=False)
+      self.bytes -= sprite_bytes(old)
+      self.evictions += 1
+    return sprite
+
+  def hit_rate(self) -> float:
+    total = self.hits + self.misses
+    return self.hits / total if total else 0
+
+  def __str__(self) -> str:
+    return f'sprite cache: hit rate {self.hit_rate():.1%} ({self.hits}/{self.hits + self.misses}), {len(self.sprites)} sprites in {self.bytes / 2 ** 20:.1f}MiB, evictions: {self.evictions}'
+
+def sprite_bytes(sprite: 'Image.Image') -> int:
+  return sprite.size[0] * sprite.size[1] * len(sprite.getbands())
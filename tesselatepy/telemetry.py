@@ -0,0 +1,170 @@
+import json
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+from typing import Any, Callable, ContextManager, Dict, IO, Iterable, Iterator, List, Optional, TypeVar
+
+
+T = TypeVar('T')
+
+# Something measured while drawing, t and duration in seconds since the
+# instrument was created:
+# - 'span': the stage name ran from t for duration
+# - 'progress': args are done and total items of name
+# - 'counters': args are the totals of the counters and timers so far,
+#   timers in seconds
+class Event:
+  def __init__(self, kind: str, name: str, t: float, duration: float = 0, args: Optional[Dict[str, Any]] = None):
+    self.kind = kind
+    self.name = name
+    self.t = t
+    self.duration = duration
+    self.args = args or {}
+
+  def to_dict(self) -> Dict[str, Any]:
+    return {'kind': self.kind, 'name': self.name, 't': self.t, 'duration': self.duration, 'args': self.args}
+
+Hook = Callable[[Event], None]
+
+# Collects counters and timers and passes events to the hooks. Hooks with
+# a close method are closed with the instrument.
+class Instrument:
+  def __init__(self, hooks: Iterable[Hook] = ()):
+    self.hooks: List[Hook] = list(hooks)
+    self.origin = perf_counter()
+    self.counters: Dict[str, float] = {}
+    # accumulated seconds of the timers
+    self.timers: Dict[str, float] = {}
+
+  def now(self) -> float:
+    return perf_counter() - self.origin
+
+  def emit(self, event: Event):
+    for hook in self.hooks:
+      hook(event)
+
+  def count(self, name: str, n: float = 1):
+    self.counters[name] = self.counters.get(name, 0) + n
+
+  # keep the largest value of the counter
+  def maximum(self, name: str, value: float):
+    if value > self.counters.get(name, value - 1):
+      self.counters[name] = value
+
+  # a stage, emitted as a span with args when it ends
+  @contextmanager
+  def span(self, name: str, **args: Any) -> Iterator[None]:
+    start = self.now()
+    try:
+      yield
+    finally:
+      self.emit(Event('span', name, start, self.now() - start, args))
+
+  # time added to the timer name, for work interleaved with other work
+  @contextmanager
+  def timer(self, name: str) -> Iterator[None]:
+    start = perf_counter()
+    try:
+      yield
+    finally:
+      self.timers[name] = self.timers.get(name, 0) + perf_counter() - start
+
+  def progress(self, name: str, done: int, total: int):
+    self.emit(Event('progress', name, self.now(), args={'done': done, 'total': total}))
+
+  def snapshot(self):
+    self.emit(Event('counters', 'counters', self.now(), args={**self.counters, **{f'{name}_seconds': seconds for name, seconds in self.timers.items()}}))
+
+  def close(self):
+    self.snapshot()
+    for hook in self.hooks:
+      close = getattr(hook, 'close', None)
+      if close:
+        close()
+
+# The instrument of the running drawing, None when it isn't traced. The
+# functions below do nothing then, so the drawing code calls them freely.
+# Work done in --workers processes isn't counted.
+current: Optional[Instrument] = None
+
+@contextmanager
+def tracing(instrument: Instrument) -> Iterator[Instrument]:
+  global current
+  previous = current
+  current = instrument
+  try:
+    yield instrument
+  finally:
+    current = previous
+    instrument.close()
+
+def count(name: str, n: float = 1):
+  if current is not None:
+    current.count(name, n)
+
+def maximum(name: str, value: float):
+  if current is not None:
+    current.maximum(name, value)
+
+def span(name: str, **args: Any) -> ContextManager[None]:
+  return current.span(name, **args) if current is not None else nullcontext()
+
+def timer(name: str) -> ContextManager[None]:
+  return current.timer(name) if current is not None else nullcontext()
+
+def progress(name: str, done: int, total: int):
+  if current is not None:
+    current.progress(name, done, total)
+    current.snapshot()
+
+# the items of iterable, the time taken to produce them added to the timer
+def timed(name: str, iterable: Iterable[T]) -> Iterator[T]:
+  iterator = iter(iterable)
+  if current is None:
+    return iterator
+  return _timed(current, name, iterator)
+
+def _timed(instrument: Instrument, name: str, iterator: Iterator[T]) -> Iterator[T]:
+  while True:
+    with instrument.timer(name):
+      try:
+        item = next(iterator)
+      except StopIteration:
+        return
+    yield item
+
+# One JSON object per event and line.
+class JsonLines:
+  def __init__(self, f: IO[str]):
+    self.f = f
+
+  def __call__(self, event: Event):
+    self.f.write(json.dumps(event.to_dict()) + '\n')
+
+  def close(self):
+    self.f.close()
+
+# The trace event format of chrome://tracing and Perfetto, written when
+# closed: spans are complete events, progress and counters counter events.
+class ChromeTrace:
+  def __init__(self, f: IO[str]):
+    self.f = f
+    self.events: List[Dict[str, Any]] = []
+
+  def __call__(self, event: Event):
+    trace = {'name': event.name, 'ts': event.t * 1e6, 'pid': 0, 'tid': 0, 'args': event.args}
+    if event.kind == 'span':
+      trace.update(ph='X', dur=event.duration * 1e6)
+    else:
+      trace.update(ph='C')
+    if event.kind == 'progress':
+      trace['args'] = {'done': event.args['done']}
+    self.events.append(trace)
+
+  def close(self):
+    json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, self.f)
+    self.f.close()
+
+# an instrument writing to fname, JSON lines for .jsonl, else a Chrome trace
+def open_trace(fname: str) -> Instrument:
+  f = open(fname, 'w')
+  return Instrument([JsonLines(f) if fname.endswith('.jsonl') else ChromeTrace(f)])
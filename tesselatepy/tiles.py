@@ -0,0 +1,145 @@
+import pickle
+import struct
+import zlib
+from mmap import mmap
+from tempfile import TemporaryFile
+from typing import Any, IO, List, Optional, Sequence, Tuple
+from PIL import Image
+from PIL import ImageDraw
+
+
+# A drawing operation with the bounding box of the pixels it may touch:
+# (x0, y0, x1, y1, kind, args)
+Operation = Tuple[int, int, int, int, str, Tuple[Any, ...]]
+
+# Canvas for images too large to keep in memory. It records polygon, line,
+# point and paste operations like ImageDraw and Image.paste, spilled to a
+# temporary file for each row of blocks they touch. save() then draws each
+# block of block x block pixels by itself, in the same order, and writes
+# the image one row of blocks at a time: PNG is encoded as it goes, other
+# formats thru a memory mapped raw buffer. Only one row of blocks and its
+# operations are in memory at a time.
+class TiledCanvas:
+  def __init__(self, width: int, height: int, block: int):
+    self.width = width
+    self.height = height
+    self.block = block
+    self.rows: List[IO[bytes]] = [TemporaryFile() for _ in range(0, height, block)]
+
+  def _record(self, x0: float, y0: float, x1: float, y1: float, kind: str, args: Tuple[Any, ...]):
+    # a pixel of margin for the rounding of the rasterizer
+    operation = (int(x0) - 1, int(y0) - 1, int(x1) + 2, int(y1) + 2, kind, args)
+    first = max(0, operation[1] // self.block)
+    last = min(len(self.rows) - 1, operation[3] // self.block)
+    for row in range(first, last + 1):
+      pickle.dump(operation, self.rows[row])
+
+  # xy is a flat sequence of coordinates or a sequence of (x, y)
+  def polygon(self, xy: Sequence[Any], fill: Any = None):
+    xs, ys = _split(xy)
+    if xs:
+      self._record(min(xs), min(ys), max(xs), max(ys), 'polygon', (xs, ys, fill))
+
+  def line(self, xy: Sequence[Any], fill: Any = None):
+    xs, ys = _split(xy)
+    if xs:
+      self._record(min(xs), min(ys), max(xs), max(ys), 'line', (xs, ys, fill))
+
+  def point(self, xy: Sequence[Any], fill: Any = None):
+    xs, ys = _split(xy)
+    if xs:
+      self._record(min(xs), min(ys), max(xs), max(ys), 'point', (xs, ys, fill))
+
+  # same as Image.paste with a 2-tuple box
+  def paste(self, im: 'Image.Image', box: Tuple[int, int], mask: Optional['Image.Image'] = None):
+    x, y = box
+    self._record(x, y, x + im.size[0], y + im.size[1], 'paste', (im, x, y, mask is im))
+
+  # the RGBA pixels of a row of blocks
+  def render(self, row: int) -> bytes:
+    block = self.block
+    spill = self.rows[row]
+    spill.seek(0)
+    operations: List[Operation] = []
+    while True:
+      try:
+        operations.append(pickle.load(spill))
+      except EOFError:
+        break
+    spill.close()
+    y0 = row * block
+    height = min(block, self.height - y0)
+    stride = self.width * 4
+    strip = bytearray(stride * height)
+    for x0 in range(0, self.width, block):
+      width = min(block, self.width - x0)
+      im = Image.new('RGBA', (width, height))
+      draw = ImageDraw.Draw(im)
+      for ox0, _, ox1, _, kind, args in operations:
+        if ox1 < x0 or ox0 >= x0 + width: continue
+        if kind == 'paste':
+          sprite, x, y, masked = args
+          im.paste(sprite, (x - x0, y - y0), sprite if masked else None)
+          continue
+        xs, ys, fill = args
+        pts = [(x - x0, y - y0) for x, y in zip(xs, ys)]
+        if kind == 'polygon':
+          draw.polygon(pts, fill=fill)
+        elif kind == 'line':
+          draw.line(pts, fill=fill)
+        else:
+          draw.point(pts, fill=fill)
+      data = im.tobytes()
+      for y in range(height):
+        strip[y * stride + x0 * 4:y * stride + (x0 + width) * 4] = data[y * width * 4:(y + 1) * width * 4]
+    return bytes(strip)
+
+  # JPEG has no alpha, the transparent pixels are saved black as by
+  # Image.convert('RGB')
+  def save(self, fname: str):
+    if fname.endswith('.png'):
+      with open(fname, 'wb') as f:
+        png = PngWriter(f, self.width, self.height)
+        for row in range(len(self.rows)):
+          png.write(self.render(row))
+        png.close()
+      return
+    with TemporaryFile() as f:
+      f.truncate(self.width * self.height * 4)
+      with mmap(f.fileno(), self.width * self.height * 4) as buffer:
+        stride = self.width * 4
+        for row in range(len(self.rows)):
+          strip = self.render(row)
+          start = row * self.block * stride
+          buffer[start:start + len(strip)] = strip
+        mode = 'RGBX' if fname.endswith('.jpg') else 'RGBA'
+        Image.frombuffer(mode, (self.width, self.height), buffer, 'raw', mode, 0, 1).save(fname)
+
+# Writes 8-bit RGBA PNG rows as they come, the pixel data is compressed
+# incrementally.
+class PngWriter:
+  def __init__(self, f: IO[bytes], width: int, height: int):
+    self.f = f
+    self.stride = width * 4
+    self.compressor = zlib.compressobj(6)
+    f.write(b'\x89PNG\r\n\x1a\n')
+    self.chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+
+  def chunk(self, kind: bytes, data: bytes):
+    self.f.write(struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data)))
+
+  # whole rows of pixels, each row is stored without a filter
+  def write(self, pixels: bytes):
+    stride = self.stride
+    data = b''.join(self.compressor.compress(b'\x00' + pixels[i:i + stride]) for i in range(0, len(pixels), stride))
+    if data:
+      self.chunk(b'IDAT', data)
+
+  def close(self):
+    self.chunk(b'IDAT', self.compressor.flush())
+    self.chunk(b'IEND', b'')
+
+def _split(xy: Sequence[Any]) -> Tuple[List[Any], List[Any]]:
+  if xy and isinstance(xy[0], tuple):
+    return [x for x, _ in xy], [y for _, y in xy]
+  return list(xy[0::2]), list(xy[1::2])
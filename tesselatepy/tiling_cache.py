@@ -0,0 +1,182 @@
+import hashlib
+import os
+import struct
+from array import array
+from mmap import mmap, ACCESS_READ
+from tempfile import NamedTemporaryFile
+from typing import Any, List, Optional, Tuple
+import backend
+import decimal_math
+import line
+import mobius
+import point
+import polygon
+import poincare_disk
+import telemetry
+from decimal_math import Decimal
+from point import Point
+from poincare_disk import DiskParams, PoincareDisk, assign_colors, count_polys, determine_polys
+from polygon_store import PolygonStore
+
+
+# Bumped when the file layout changes. Changes of the geometry code change
+# the version stamp by themselves, see geometry_version.
+CACHE_FORMAT = 2
+DEFAULT_CACHE_BUDGET = 512 * 2 ** 20
+SUFFIX = '.tiling'
+MAGIC = b'TSLC'
+# magic, format, decimal coordinates, n, k, layers, inner, total, bytes of
+# the coordinates, version stamp
+HEADER = struct.Struct('<4sHHIIIQQQ32s')
+
+# A stamp of the code that determines the coordinates of a tiling, so
+# entries of older code are never loaded.
+_version: Optional[bytes] = None
+
+def geometry_version() -> bytes:
+  global _version
+  if _version is None:
+    # inspect is a slow import, only runs with a cache need it
+    import inspect
+    digest = hashlib.sha256(str(CACHE_FORMAT).encode())
+    for source in (decimal_math, point, line, polygon, mobius, backend):
+      digest.update(inspect.getsource(source).encode())
+    for function in (poincare_disk.count_layers, poincare_disk.apply_rule, poincare_disk.determine_polys):
+      digest.update(inspect.getsource(function).encode())
+    _version = digest.digest()
+  return _version
+
+# Generated tilings in a folder, one file per (p, q, layers, backend) and
+# version of the geometry code. A file has a header, the tables of the
+# rule, parents and sides of the polygons, the vertex offsets and the
+# coordinates, float64 mapped into memory by the float backends and
+# Decimal text for the decimal one. The colors aren't kept, they are drawn
+# for each load the same as PoincareDisk.new draws them. Files that weren't
+# used lately are deleted beyond budget bytes. Entries are written to a
+# temporary file and renamed, so processes can share the folder. Only the
+# regular tilings of DiskParams are generated, so there are no
+# quasiregular entries.
+class TilingCache:
+  def __init__(self, folder: str, budget: int = DEFAULT_CACHE_BUDGET):
+    self.folder = folder
+    self.budget = budget
+    self.hits = 0
+    self.misses = 0
+    os.makedirs(folder, exist_ok=True)
+
+  def path(self, params: DiskParams) -> str:
+    key = f'{params.n},{params.k},{params.layers},{params.backend}'.encode()
+    return os.path.join(self.folder, hashlib.sha256(geometry_version() + key).hexdigest()[:32] + SUFFIX)
+
+  # the tiling of params, loaded or generated and stored
+  def get(self, params: DiskParams) -> PoincareDisk:
+    path = self.path(params)
+    disk = None
+    try:
+      disk = read_tiling(path, params)
+    except (OSError, ValueError, struct.error):
+      pass
+    if disk is not None:
+      self.hits += 1
+      telemetry.count('tiling_cache_hits')
+      # the file was used lately
+      os.utime(path)
+      return disk
+    self.misses += 1
+    telemetry.count('tiling_cache_misses')
+    inner, total = count_polys(params)
+    disk = determine_polys(inner, total, params)
+    write_tiling(path, params, disk)
+    self.evict(keep=path)
+    return disk
+
+  # delete the least recently used files beyond the budget
+  def evict(self, keep: str = ''):
+    entries: List[Tuple[float, int, str]] = []
+    for name in os.listdir(self.folder):
+      if not name.endswith(SUFFIX): continue
+      path = os.path.join(self.folder, name)
+      try:
+        stat = os.stat(path)
+      except OSError:
+        continue
+      entries.append((stat.st_mtime, stat.st_size, path))
+    size = sum(entry[1] for entry in entries)
+    for _, entry_size, path in sorted(entries):
+      if size <= self.budget: break
+      if path == keep: continue
+      try:
+        os.remove(path)
+      except OSError:
+        continue
+      size -= entry_size
+
+  def __str__(self) -> str:
+    return f'tiling cache: {self.hits} hits, {self.misses} misses in {self.folder}'
+
+def write_tiling(path: str, params: DiskParams, disk: PoincareDisk):
+  polys = disk.polys
+  is_decimal = not isinstance(polys, PolygonStore)
+  if is_decimal:
+    offsets = array('q', [0])
+    values = []
+    for poly in polys:
+      for pt in poly:
+        values.append(str(pt.x))
+        values.append(str(pt.y))
+      offsets.append(len(values) // 2)
+    coords = ' '.join(values).encode()
+  else:
+    offsets = array('q', polys.offsets)
+    coords = bytes(polys.coords)
+  sections = [array('b', disk.rule).tobytes(), array('i', disk.parents).tobytes(), array('b', disk.sides).tobytes(), offsets.tobytes(), coords]
+  header = HEADER.pack(MAGIC, CACHE_FORMAT, is_decimal, params.n, params.k, params.layers, disk.inner, disk.total, len(coords), geometry_version())
+  folder = os.path.dirname(path)
+  with NamedTemporaryFile('wb', dir=folder, suffix='.tmp', delete=False) as f:
+    try:
+      f.write(_pad(header))
+      for section in sections:
+        f.write(_pad(section))
+    except OSError:
+      f.close()
+      os.remove(f.name)
+      raise
+  os.replace(f.name, path)
+
+# The tiling in the file, None if it isn't one of params and this version.
+# Float coordinates stay in the memory mapped file.
+def read_tiling(path: str, params: DiskParams) -> Optional[PoincareDisk]:
+  with open(path, 'rb') as f:
+    data = mmap(f.fileno(), 0, access=ACCESS_READ)
+  magic, version, is_decimal, n, k, layers, inner, total, coord_bytes, stamp = HEADER.unpack_from(data)
+  if magic != MAGIC or version != CACHE_FORMAT or stamp != geometry_version() or (n, k, layers) != (params.n, params.k, params.layers):
+    return None
+  sizes = [total, 4 * total, total, 8 * (total + 1), coord_bytes]
+  if len(data) < _padded(HEADER.size) + sum(map(_padded, sizes)):
+    return None
+  view = memoryview(data)
+  position = _padded(HEADER.size)
+
+  def section(size: int) -> memoryview:
+    nonlocal position
+    result = view[position:position + size]
+    position += _padded(size)
+    return result
+
+  rule, parents, sides, offsets, coords = map(section, sizes)
+  rule = list(rule.cast('b'))
+  parents = list(parents.cast('i'))
+  sides = list(sides.cast('b'))
+  offsets = offsets.cast('q')
+  if is_decimal:
+    values = [Decimal(value) for value in bytes(coords).decode().split()]
+    polys: Any = [[Point(values[2 * i], values[2 * i + 1]) for i in range(offsets[j], offsets[j + 1])] for j in range(total)]
+  else:
+    polys = PolygonStore(coords.cast('d'), offsets)
+  return PoincareDisk(n, k, polys, rule, total, inner, assign_colors(params, parents), parents, sides)
+
+def _padded(size: int) -> int:
+  return (size + 7) // 8 * 8
+
+def _pad(data: bytes) -> bytes:
+  return data + bytes(_padded(len(data)) - len(data))
@@ -0,0 +1,90 @@
+from array import array
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+
+# Adjacency of the polygons of a tiling, derived from the rule alone.
+# Side s of polygon j has the id j * n + s, and neighbors[j * n + s] is the
+# id of the same edge seen from the adjacent polygon, -1 if that polygon
+# wasn't generated. The vertex i of a polygon is the start of its side i.
+#
+# Polygon j is the reflection of parents[j] thru its side sides[j], which
+# makes its side 0 the shared one. The other adjacencies are found around
+# the vertices: when the k polygons around a vertex are known and linked
+# in a row, the first and the last one share an edge too.
+class Topology:
+  def __init__(self, n: int, k: int, parents: Sequence[int], sides: Sequence[int]):
+    self.n = n
+    self.k = k
+    self.neighbors = array('q', [-1]) * (len(parents) * n)
+    for j in range(1, len(parents)):
+      self._link(j * n, parents[j] * n + sides[j])
+
+  def _link(self, a: int, b: int):
+    n = self.n
+    neighbors = self.neighbors
+    neighbors[a] = b
+    neighbors[b] = a
+    # the vertices at both ends of the edge may be closed by now
+    todo = [a, a - a % n + (a + 1) % n]
+    while todo:
+      side = self._close(todo.pop())
+      if side is None: continue
+      a, b = side
+      neighbors[a] = b
+      neighbors[b] = a
+      todo.append(a - a % n + (a + 1) % n)
+      todo.append(b)
+
+  # Link the polygons around the vertex if all k of them are known, return
+  # the new pair of sides or None. The same edge is the side i of P and
+  # the side u of Q with P[i] = Q[u + 1] and P[i + 1] = Q[u].
+  def _close(self, corner: int) -> Optional[Tuple[int, int]]:
+    n = self.n
+    neighbors = self.neighbors
+    count = 1
+    # walk across the sides starting at the vertex
+    last = corner
+    while True:
+      side = neighbors[last]
+      if side == -1: break
+      last = side - side % n + (side + 1) % n
+      if last == corner: return None
+      count += 1
+    # and back across the sides ending at it
+    first = corner
+    while True:
+      side = neighbors[first - first % n + (first - 1) % n]
+      if side == -1: break
+      first = side
+      count += 1
+    if count < self.k: return None
+    return last, first - first % n + (first - 1) % n
+
+  def __len__(self) -> int:
+    return len(self.neighbors) // self.n
+
+  # id of the edge shared by the side s of the polygon j and its neighbor
+  def edge(self, j: int, s: int) -> int:
+    side = j * self.n + s
+    return min(side, self.neighbors[side]) if self.neighbors[side] != -1 else side
+
+  # (polygon, side) of the other side of the edge or None
+  def neighbor(self, j: int, s: int) -> Optional[Tuple[int, int]]:
+    side = self.neighbors[j * self.n + s]
+    return divmod(side, self.n) if side != -1 else None
+
+  # the edge is drawn with the polygon of the lowest index
+  def owns(self, j: int, s: int) -> bool:
+    return self.edge(j, s) == j * self.n + s
+
+  # (polygon, side, neighbor polygon or -1) once for every edge, by polygon
+  def edges(self) -> Iterator[Tuple[int, int, int]]:
+    n = self.n
+    for side, other in enumerate(self.neighbors):
+      if other == -1 or other > side:
+        yield side // n, side % n, other // n if other != -1 else -1
+
+  # the dual graph: polygons adjacent to the polygon j
+  def adjacent(self, j: int) -> List[int]:
+    n = self.n
+    return [side // n for side in self.neighbors[j * n:(j + 1) * n] if side != -1]
@@ -0,0 +1,207 @@
+import math
+import os
+import zlib
+from typing import BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple
+from PIL.ImageColor import getrgb
+from poincare_disk import DiskParams, Color, iter_polys
+from polygon import Polygon, screen_extent
+from line import Line, CircleLine
+from decimal_math import decimal_context
+from tiling_cache import TilingCache
+from formats import VECTOR_FORMATS
+import telemetry
+
+
+# decimals of the pixel coordinates written
+DIGITS = 2
+# polygons smaller than this many pixels are left out
+MIN_VECTOR_SIZE = 0.5
+
+# screen center and radius of the arc of a side, None for a straight side
+Circle = Optional[Tuple[float, float, float]]
+Vertex = Tuple[str, str]
+
+# The screen circles of the sides shared by neighboring polygons, like
+# polygon.EdgeCache: the first polygon on a side builds its line, the
+# second one takes the circle and runs the arc the other way. Sides are
+# keyed by their vertices as written, and dropped once taken.
+class EdgeCircles:
+  def __init__(self, width: int, height: int):
+    self.x_center = width // 2
+    self.y_center = height // 2
+    self.radius = min(self.x_center, self.y_center)
+    self.circles: Dict[Tuple[Vertex, Vertex], Circle] = {}
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, poly: Polygon, i: int, j: int, vertices: List[Vertex]) -> Circle:
+    key = (vertices[i], vertices[j]) if vertices[i] < vertices[j] else (vertices[j], vertices[i])
+    if key in self.circles:
+      self.hits += 1
+      return self.circles.pop(key)
+    self.misses += 1
+    line = Line.new(poly[i], poly[j])
+    circle = None
+    if isinstance(line, CircleLine):
+      circle = (float(line.c.x) * self.radius + self.x_center, float(line.c.y) * self.radius + self.y_center, float(line.r) * self.radius)
+    self.circles[key] = circle
+    return circle
+
+# The polygons of params as (color, screen vertices, circle of each side).
+# Polygons smaller than min_size pixels are left out, and the rule isn't
+# applied to the ones with only smaller descendants, see iter_polys. With
+# a cache the tiling is loaded from there or stored and left out polygons
+# are generated all the same.
+def vector_polys(params: DiskParams, min_size: float = MIN_VECTOR_SIZE, cache: Optional[TilingCache] = None) -> Iterable[Tuple[Color, List[Tuple[float, float]], List[Circle]]]:
+  width, height = params.width, params.height
+  x_center, y_center = width // 2, height // 2
+  radius = min(x_center, y_center)
+  polys = cache.get(params).iter_polys() if cache else iter_polys(params, min_size=min_size)
+  edges = EdgeCircles(width, height)
+  omitted = 0
+  for _, poly, color, _ in polys:
+    if screen_extent(poly, width, height) < min_size:
+      omitted += 1
+      continue
+    points = [(float(pt.x) * radius + x_center, float(pt.y) * radius + y_center) for pt in poly]
+    vertices = [(number(x), number(y)) for x, y in points]
+    n = len(points)
+    yield color, points, [edges.get(poly, i, (i + 1) % n, vertices) for i in range(n)]
+  telemetry.count('omitted_polys', omitted)
+  telemetry.count('edge_hits', edges.hits)
+  telemetry.count('edge_misses', edges.misses)
+
+def number(x: float) -> str:
+  return f'{x:.{DIGITS}f}'
+
+# Poincare model polygons as SVG paths with one arc command per side.
+class SvgWriter:
+  def __init__(self, f: BinaryIO, width: int, height: int):
+    self.f = f
+    self.colors: Dict[Color, str] = {}
+    f.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">\n'.encode())
+
+  def polygon(self, color: Color, points: List[Tuple[float, float]], circles: List[Circle]):
+    fill = self.colors.get(color)
+    if fill is None:
+      fill = self.colors[color] = '#%02x%02x%02x' % getrgb(color)[:3]
+    x, y = points[0]
+    d = [f'M{number(x)} {number(y)}']
+    n = len(points)
+    for i in range(n):
+      ax, ay = points[i]
+      bx, by = points[(i + 1) % n]
+      circle = circles[i]
+      if circle is None:
+        d.append(f'L{number(bx)} {number(by)}')
+        continue
+      cx, cy, r = circle
+      # the sides are less than half a circle, the sweep flag is set for
+      # growing angles, clockwise on the screen
+      sweep = int((ax - cx) * (by - cy) - (ay - cy) * (bx - cx) > 0)
+      d.append(f'A{number(r)} {number(r)} 0 0 {sweep} {number(bx)} {number(by)}')
+    self.f.write(f'<path fill="{fill}" d="{"".join(d)}Z"/>\n'.encode())
+
+  def close(self):
+    self.f.write(b'</svg>\n')
+
+# Poincare model polygons as a single page PDF of width by height points.
+# PDF has no arcs, every side becomes cubic Bezier curves of at most a
+# quarter circle each. The page content is compressed as it's written.
+class PdfWriter:
+  def __init__(self, f: BinaryIO, width: int, height: int):
+    self.f = f
+    self.colors: Dict[Color, bytes] = {}
+    self.offsets: List[int] = []
+    self.compressor = zlib.compressobj()
+    self.length = 0
+    f.write(b'%PDF-1.4\n')
+    self.object(b'<< /Type /Catalog /Pages 2 0 R >>')
+    self.object(b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>')
+    self.object(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] /Contents 4 0 R /Resources << >> >>'.encode())
+    self.offsets.append(f.tell())
+    f.write(b'4 0 obj\n<< /Length 5 0 R /Filter /FlateDecode >>\nstream\n')
+    # the screen y axis points down
+    self.write(f'1 0 0 -1 0 {height} cm\n'.encode())
+
+  def object(self, body: bytes):
+    self.offsets.append(self.f.tell())
+    self.f.write(b'%d 0 obj\n%s\nendobj\n' % (len(self.offsets), body))
+
+  def write(self, data: bytes):
+    compressed = self.compressor.compress(data)
+    self.length += len(compressed)
+    self.f.write(compressed)
+
+  def polygon(self, color: Color, points: List[Tuple[float, float]], circles: List[Circle]):
+    fill = self.colors.get(color)
+    if fill is None:
+      fill = self.colors[color] = ('%.3f %.3f %.3f rg\n' % tuple(c / 255 for c in getrgb(color)[:3])).encode()
+    x, y = points[0]
+    ops = [f'{number(x)} {number(y)} m']
+    n = len(points)
+    for i in range(n):
+      circle = circles[i]
+      if circle is None:
+        bx, by = points[(i + 1) % n]
+        ops.append(f'{number(bx)} {number(by)} l')
+        continue
+      ops.extend(bezier_arc(points[i], points[(i + 1) % n], circle))
+    ops.append('h f\n')
+    self.write(fill + '\n'.join(ops).encode())
+
+  def close(self):
+    f = self.f
+    compressed = self.compressor.flush()
+    self.length += len(compressed)
+    f.write(compressed)
+    f.write(b'\nendstream\nendobj\n')
+    self.object(str(self.length).encode())
+    xref = f.tell()
+    f.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(self.offsets) + 1))
+    for offset in self.offsets:
+      f.write(b'%010d 00000 n \n' % offset)
+    f.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(self.offsets) + 1, xref))
+
+# PDF curve operators for the short arc of the circle from a to b, the
+# control points at 4/3 tan(step / 4) radii along the tangents
+def bezier_arc(a: Tuple[float, float], b: Tuple[float, float], circle: Tuple[float, float, float]) -> List[str]:
+  cx, cy, r = circle
+  alpha = math.atan2(a[1] - cy, a[0] - cx)
+  sweep = math.atan2(b[1] - cy, b[0] - cx) - alpha
+  if sweep > math.pi:
+    sweep -= 2 * math.pi
+  elif sweep < -math.pi:
+    sweep += 2 * math.pi
+  segments = max(1, math.ceil(abs(sweep) / (math.pi / 2)))
+  step = sweep / segments
+  k = 4 / 3 * math.tan(step / 4)
+  ops = []
+  for s in range(segments):
+    t0 = alpha + s * step
+    t1 = t0 + step
+    c0, s0, c1, s1 = math.cos(t0), math.sin(t0), math.cos(t1), math.sin(t1)
+    # the end of the last segment is the vertex itself
+    x, y = b if s == segments - 1 else (cx + r * c1, cy + r * s1)
+    ops.append(f'{number(cx + r * (c0 - k * s0))} {number(cy + r * (s0 + k * c0))} {number(cx + r * (c1 + k * s1))} {number(cy + r * (s1 - k * c1))} {number(x)} {number(y)} c')
+  return ops
+
+# Write the Poincare model to a .svg or .pdf file in params.width by
+# params.height pixels, see vector_polys. The arcs are exact, so the size
+# of the file follows the number of polygons instead of the image size.
+def write_vector(params: DiskParams, output: str, min_size: float = 0, cache: Optional[TilingCache] = None, log: Callable[..., None] = print):
+  with open(output, 'wb') as f:
+    save_vector(params, f, os.path.splitext(output)[1], min_size, cache, log)
+
+# the vector drawing of write_vector to a binary file, format is one of
+# VECTOR_FORMATS
+def save_vector(params: DiskParams, f: BinaryIO, format: str, min_size: float = 0, cache: Optional[TilingCache] = None, log: Callable[..., None] = print):
+  writer = (PdfWriter if format.lower() == '.pdf' else SvgWriter)(f, params.width, params.height)
+  drawn = 0
+  with decimal_context(), telemetry.span('vector', format=format):
+    for color, points, circles in vector_polys(params, max(min_size, MIN_VECTOR_SIZE), cache):
+      writer.polygon(color, points, circles)
+      drawn += 1
+    writer.close()
+  telemetry.count('vector_polys', drawn)
+  log(f'polys written: {drawn}')
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the modules import each other by their plain names, as run from tesselatepy/
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'tesselatepy'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
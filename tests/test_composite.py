@@ -0,0 +1,18 @@
+import random
+import pytest
+from PIL import Image
+from poincare_disk import DiskParams
+from render import render
+
+pytest.importorskip('numpy')
+
+
+# A transparent edge image leaves every batch of lines without a sample to
+# blend, the drawing is then the polygons alone, as with pasting.
+def test_transparent_edge_images():
+  fishes = [Image.new('RGBA', (40, 20), (255, 0, 0, 0))]
+  images = []
+  for vectorized in [False, True]:
+    random.seed(1)
+    images.append(render(DiskParams(5, 4, 2, 200, [], 'float'), 'klein', fishes, vectorized=vectorized))
+  assert images[0].tobytes() == images[1].tobytes()
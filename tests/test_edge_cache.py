@@ -0,0 +1,18 @@
+import pytest
+from decimal_math import decimal_context
+from poincare_disk import DiskParams, PoincareDisk
+from polygon import EdgeCache, get_scl
+
+
+# Every side taken from the cache must give the points of flattening it
+# again, in the order of the polygon taking it.
+@pytest.mark.parametrize('backend', ['decimal', 'float'])
+@pytest.mark.parametrize('p, q, layers, size, flatness', [(5, 4, 3, 400, 0.25), (7, 3, 4, 800, 0.25), (4, 6, 3, 1600, 1), (3, 7, 5, 300, 0.1)])
+def test_shared_edges_match_flattening(p: int, q: int, layers: int, size: int, flatness: float, backend: str):
+  with decimal_context():
+    disk = PoincareDisk.new(DiskParams(p, q, layers, size, [], backend))
+    edges = EdgeCache()
+    for poly in disk.polys:
+      shared = list(get_scl(poly, size, size, flatness, edges=edges).coords)
+      assert shared == list(get_scl(poly, size, size, flatness).coords)
+  assert edges.hits > 0
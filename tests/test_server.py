@@ -0,0 +1,31 @@
+import os
+from PIL import Image
+from server import Server, TilingMemory
+
+
+# argparse errors and --help are answered in the response, the streams of
+# the process stay as they are for the renders running meanwhile
+def test_argument_errors_are_answered(capsys):
+  server = Server(TilingMemory())
+  response = server.render({'id': 1, 'argv': ['-p', '5', '--bogus']})
+  assert not response['ok']
+  assert 'required: --adjacency/-q' in response['error']
+  assert response['log'][0].startswith('usage:')
+  response = server.render({'id': 2, 'argv': ['--help']})
+  assert not response['ok'] and 'estimate polygon counts' in response['error']
+  assert capsys.readouterr() == ('', '')
+
+def test_block_messages_go_to_the_log(tmp_path):
+  server = Server(TilingMemory())
+  output = str(tmp_path / 'a.png')
+  response = server.render({'id': 1, 'argv': ['-p', '5', '-q', '4', '--layers', '2', '--size', '200', '--poincare', '--block', '64', '-o', output]})
+  assert response['ok'] and 'rendering blocks...' in response['log']
+
+def test_changed_images_replace_their_entry(tmp_path):
+  server = Server(TilingMemory())
+  path = str(tmp_path / 'edge.png')
+  for i, color in enumerate(['red', 'blue']):
+    Image.new('RGBA', (4, 4), color).save(path)
+    os.utime(path, (i, i))
+    assert server.load(path).getpixel((0, 0))[2] == 255 * i
+  assert len(server.images) == 1
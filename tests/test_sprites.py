@@ -0,0 +1,22 @@
+from PIL import Image
+from sprites import SpriteCache
+
+
+# Edge images made for each drawing and dropped after it, as with a cache
+# shared between render.render calls: an image must never get the sprites
+# of an earlier one that had the same id.
+def test_new_images_get_their_own_sprites():
+  sprites = SpriteCache()
+  for i in range(64):
+    color = (255, 0, 0, 255) if i % 2 else (0, 0, 255, 255)
+    image = Image.new('RGBA', (20, 10), color)
+    sprite = sprites.get(image, 20, 10, 0)
+    assert sprite.getpixel((10, 5)) == color
+    del image
+
+def test_sprites_are_reused():
+  sprites = SpriteCache(angle_step=1)
+  image = Image.new('RGBA', (20, 10), (0, 255, 0, 255))
+  first = sprites.get(image, 20, 10, 30.2)
+  assert sprites.get(image, 20, 10, 29.8) is first
+  assert sprites.hits == 1 and sprites.misses == 1
@@ -0,0 +1,42 @@
+import os
+import random
+import pytest
+from typing import List, Tuple
+from decimal_math import decimal_context
+from poincare_disk import DiskParams, PoincareDisk
+from tiling_cache import TilingCache
+
+
+def points(disk: PoincareDisk) -> List[List[Tuple]]:
+  return [[(pt.x, pt.y) for pt in poly] for poly in disk.polys]
+
+# The colors are drawn for every load, the same as for the stored tiling
+# with the same seed. DiskParams draws where its colors start.
+def seeded_params(backend: str) -> DiskParams:
+  random.seed(1)
+  return DiskParams(5, 4, 3, 400, [], backend)
+
+@pytest.mark.parametrize('backend', ['decimal', 'float', 'mobius'])
+def test_round_trip(tmp_path, backend: str):
+  cache = TilingCache(str(tmp_path))
+  with decimal_context():
+    stored = cache.get(seeded_params(backend))
+    loaded = cache.get(seeded_params(backend))
+  assert (cache.misses, cache.hits) == (1, 1)
+  assert points(loaded) == points(stored)
+  assert list(loaded.parents) == list(stored.parents)
+  assert list(loaded.sides) == list(stored.sides)
+  assert list(loaded.rule) == list(stored.rule)
+  assert loaded.colors == stored.colors
+  assert (loaded.inner, loaded.total) == (stored.inner, stored.total)
+
+def test_damaged_entry_is_generated_again(tmp_path):
+  params = DiskParams(5, 4, 2, 400, [], 'float')
+  cache = TilingCache(str(tmp_path))
+  stored = cache.get(params)
+  path = cache.path(params)
+  with open(path, 'r+b') as f:
+    f.truncate(os.path.getsize(path) // 2)
+  loaded = cache.get(params)
+  assert (cache.misses, cache.hits) == (2, 0)
+  assert points(loaded) == points(stored)
@@ -0,0 +1,29 @@
+import pytest
+from decimal_math import decimal_context
+from poincare_disk import DiskParams, PoincareDisk
+from unique_lines import UniqueLines
+
+
+TILINGS = [(5, 4, 3), (4, 5, 3), (7, 3, 4), (3, 7, 5), (6, 4, 2)]
+
+@pytest.mark.parametrize('backend', ['decimal', 'float'])
+@pytest.mark.parametrize('p, q, layers', TILINGS)
+def test_edges_match_unique_lines(p: int, q: int, layers: int, backend: str):
+  with decimal_context():
+    disk = PoincareDisk.new(DiskParams(p, q, layers, 800, [], backend))
+    unique = UniqueLines()
+    for poly in disk.polys:
+      unique.add(poly)
+    # the end points as indices of the vertices within tolerance
+    edges = [tuple(sorted((unique.index(disk.polys[j][s]), unique.index(disk.polys[j][(s + 1) % p])))) for j, s, _ in disk.edges()]
+  assert len(edges) == len(set(edges))
+  assert set(edges) == set(unique.lines)
+
+@pytest.mark.parametrize('p, q, layers', TILINGS)
+def test_neighbors_are_symmetric(p: int, q: int, layers: int):
+  topology = PoincareDisk.new(DiskParams(p, q, layers, 800, [], 'float')).topology()
+  for j in range(len(topology)):
+    for s in range(p):
+      other = topology.neighbor(j, s)
+      if other is not None:
+        assert topology.neighbor(*other) == (j, s)